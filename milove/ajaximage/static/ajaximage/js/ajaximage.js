@@ -7,7 +7,11 @@
         if (parts.length === 2) return parts.pop().split(';').shift()
     };
 
-    var request = function (method, url, data, headers, el, showProgress, cb) {
+    var CHUNK_SIZE = 512 * 1024,
+        MAX_RETRIES = 5,
+        RETRY_DELAY = 2000;
+
+    var request = function (method, url, data, headers, onProgress, cb) {
         var req = new XMLHttpRequest();
         req.open(method, url, true);
 
@@ -20,12 +24,13 @@
         };
 
         req.onerror = function () {
-            error(el, 'Failed to upload image.');
+            // the connection is lost
+            cb(0, null);
         };
 
-        req.upload.onprogress = function (data) {
-            progressBar(el, data, showProgress);
-        };
+        if (onProgress) {
+            req.upload.onprogress = onProgress;
+        }
 
         req.send(data);
 
@@ -53,15 +58,20 @@
         return el;
     };
 
-    var progressBar = function (el, data, showProgress) {
-        if (data.lengthComputable === false || showProgress === false) return;
-
-        var pcnt = Math.round(data.loaded * 100 / data.total),
+    var progressBar = function (el, loaded, total) {
+        var pcnt = Math.round(loaded * 100 / total),
             bar = el.querySelector('.bar');
 
         bar.style.width = pcnt + '%';
     };
 
+    var errorMessage = function (data) {
+        if (!data) return 'Sorry, could not upload image.';
+        if (data.detail) return data.detail;
+        var key = Object.keys(data)[0];
+        return key ? [].concat(data[key])[0] : 'Sorry, could not upload image.';
+    };
+
     var error = function (el, msg) {
         el.querySelector('.ajaximage-file-input').value = '';
         el.querySelector('.ajaximage-img').src = '';
@@ -97,14 +107,18 @@
         });
     };
 
+    // start a chunked upload, send chunks from the offset the server has
+    // received up to, which is asked again after a lost connection,
+    // then finalize the upload to get the path of the file
     var upload = function (e) {
         var el = getEl(e.target),
             url = el.querySelector('.ajaximage-upload-url').value,
             file = el.querySelector('.ajaximage-file-input').files[0],
             img = el.querySelector('.ajaximage-img'),
-            form = new FormData(),
             headers = {'X-CSRFToken': getCookie('csrftoken')},
-            regex = /jpg|jpeg|png|gif/i;
+            regex = /jpg|jpeg|png|gif/i,
+            retries = 0,
+            uploadUrl;
 
         if (!regex.test(file.type)) {
             return alert('Incorrect image format. Allowed (jpg, gif, png).');
@@ -112,7 +126,6 @@
 
         el.className = 'ajaximage ajaximage-uploading';
         disableSubmit(true);
-        form.append('file', file);
 
         var fr = new FileReader();
         fr.onload = function () {
@@ -120,23 +133,88 @@
         };
         fr.readAsDataURL(file);
 
-        el.uploadRequest = request('POST', url, form, headers, el, true, function (status, json) {
+        var fail = function (data) {
             disableSubmit(false);
+            error(el, errorMessage(data));
+        };
 
-            var data = parseJson(json);
+        var retry = function (data) {
+            if (++retries > MAX_RETRIES) return fail(data);
+            setTimeout(resume, RETRY_DELAY);
+        };
 
-            switch (status) {
-                case 200:
+        var resume = function () {
+            // cancelled while waiting to retry
+            if (!el.uploadRequest) return;
+            el.uploadRequest = request('GET', uploadUrl, null, headers, null, function (status, json) {
+                var data = parseJson(json);
+                if (status === 200) sendChunk(data.offset);
+                else if (status === 0) retry(data);
+                else fail(data);
+            });
+        };
+
+        var sendChunk = function (offset) {
+            if (offset >= file.size) return finalize();
+
+            var chunk = file.slice(offset, offset + CHUNK_SIZE),
+                chunkHeaders = {'Content-Type': 'application/octet-stream'};
+            Object.keys(headers).forEach(function (key) {
+                chunkHeaders[key] = headers[key];
+            });
+
+            var onProgress = function (data) {
+                progressBar(el, offset + data.loaded, file.size);
+            };
+
+            el.uploadRequest = request('PUT', uploadUrl + '?offset=' + offset, chunk, chunkHeaders, onProgress, function (status, json) {
+                var data = parseJson(json);
+                switch (status) {
+                    case 200:
+                        retries = 0;
+                        progressBar(el, data.offset, file.size);
+                        sendChunk(data.offset);
+                        break;
+                    case 0:
+                        retry(data);
+                        break;
+                    case 409:
+                        resume();
+                        break;
+                    default:
+                        fail(data);
+                        break;
+                }
+            });
+        };
+
+        var finalize = function () {
+            el.uploadRequest = request('POST', uploadUrl + 'finalization/', null, headers, null, function (status, json) {
+                var data = parseJson(json);
+                if (status === 200) {
+                    disableSubmit(false);
                     update(el, data);
-                    break;
-                case 400:
-                case 403:
-                case 404:
-                    error(el, data.error);
-                    break;
-                default:
-                    error(el, 'Sorry, could not upload image.');
-                    break;
+                } else if (status === 0) {
+                    retry(data);
+                } else {
+                    fail(data);
+                }
+            });
+        };
+
+        var initHeaders = {'Content-Type': 'application/json'};
+        Object.keys(headers).forEach(function (key) {
+            initHeaders[key] = headers[key];
+        });
+        var init = JSON.stringify({filename: file.name, size: file.size});
+
+        el.uploadRequest = request('POST', url, init, initHeaders, null, function (status, json) {
+            var data = parseJson(json);
+            if (status === 201) {
+                uploadUrl = url + data.id + '/';
+                sendChunk(0);
+            } else {
+                fail(data);
             }
         });
     };
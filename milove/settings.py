@@ -91,6 +91,17 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+# version counters and cached catalog data must be shared by all workers,
+# so production settings should point this to memcached or redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -182,10 +193,13 @@ PAYPAL_MODE = 'sandbox'
 PAYPAL_CLIENT_ID = ''
 PAYPAL_CLIENT_SECRET = ''
 
-# Thread pool
+# Thread and process pools
 
 THREAD_POOL_MAX_WORKER = 20
 
+# processes of each worker rendering thumbnails and variants of images
+IMAGE_RENDER_PROCESSES = 2
+
 # Shop configuration
 
 ORDER_NOTIFICATION_GROUP_NAME = '订单管理员'
@@ -207,7 +221,45 @@ DEFAULT_HOT_CATEGORIES = 6
 DETAIL_CATEGORY_LEVEL = 3  # the level of the most detailed product category
 DEFAULT_RECOMMENDED_PRODUCTS = 4
 MAX_RECOMMENDED_PRODUCTS = 10
+RECOMMENDATION_NEIGHBOURS = 20  # precomputed similar products of a product
+# seconds to collect changed products before updating their neighbours
+RECOMMENDATION_UPDATE_DELAY = 30
+DEFAULT_PRODUCT_CHANGES = 500  # product changes in one page of change feed
+MAX_PRODUCT_CHANGES = 1000
+# seconds a product change must be old before the change feed returns it,
+# longer than any transaction recording product changes may take
+PRODUCT_CHANGES_LAG = 5
+DEFAULT_SUGGESTIONS = 10  # completions of the search box
+MAX_SUGGESTIONS = 20
+# max hamming distances between image hashes (out of 64 bits)
+SIMILAR_IMAGE_DISTANCE = 10
+DUPLICATE_IMAGE_DISTANCE = 4
+# lower bounds of the price bands in product facets, the last one is open
+PRICE_BANDS = (0, 500, 1000, 2000, 5000, 10000)
 
 MAX_UPLOAD_SIZE = 5242880
 
+# seconds before an unfinished chunked upload is discarded
+CHUNKED_UPLOAD_EXPIRATION = 24 * 60 * 60
+
+# seconds to keep serialized products in the cache,
+# changed products get new keys, so this only reclaims memory
+PRODUCT_FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+# seconds to keep responses of public catalog endpoints, they are keyed
+# on the catalog version, so this only reclaims memory as well
+CATALOG_RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# dotted path of the product search backend class,
+# None to choose one by the database vendor, see "milove/shop/search.py"
+PRODUCT_SEARCH_BACKEND = None
+
+# read-only catalog snapshot mapped by all workers, see "catalog_snapshot.py",
+# rebuilt in the background a few seconds after catalog changes, None to
+# disable it
+CATALOG_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'catalog.snapshot')
+CATALOG_SNAPSHOT_REBUILD_DELAY = 10
+# seconds a rebuild may hold the lock stopping other processes from
+# rebuilding, in case it dies without releasing it
+CATALOG_SNAPSHOT_REBUILD_TIMEOUT = 600
+
 BALANCE_ANNUALIZED_RETURN = 12.0  # annualized return of user's balance, in %
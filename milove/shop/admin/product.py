@@ -1,7 +1,8 @@
 from django import forms
 from django.conf import settings
-from django.contrib import admin
-from django.db import models as db_models
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import ugettext_lazy as _
 
 from milove.ajaximage.forms import AjaxImageField
@@ -12,44 +13,32 @@ from ..admin_filters import (
     AllValuesFieldDropdownFilter
 )
 from ..image_utils import make_image_preview_tag
+from ..image_similarity import find_similar_products
 from ..models.product import *
 
 
 class _ModelWithProductCount(admin.ModelAdmin):
-    """Base model for models that have products relationship
+    """Base model for models that have product counters
 
-    This base class adds 'product_count', 'product_for_sale_count' annotations,
-    and 'get_product_count', 'get_product_for_sale_count' methods,
-    to subclasses.
+    This base class adds 'get_product_count', 'get_product_for_sale_count'
+    methods to subclasses.
 
-    The subclasses MUST have 'products' relation,
-    which means there is a ForeignKey or other relation field
-    referring to the model, and the field's 'relation_name' is 'products'.
+    The subclasses MUST have 'product_count' and 'for_sale_count' fields,
+    which are maintained by the signal handlers of Product.
     """
 
-    def get_queryset(self, request):
-        # https://stackoverflow.com/questions/30752268/how-to-filter-objects-for-count-annotation-in-django
-        return super().get_queryset(request).annotate(
-            product_count=db_models.Count('products'),
-            product_for_sale_count=db_models.Sum(db_models.Case(
-                db_models.When(products__sold=False, then=1),
-                default=0,
-                output_field=db_models.IntegerField()
-            )),
-        )
-
     def get_product_count(self, instance: Brand):
-        return getattr(instance, 'product_count')
+        return instance.product_count
 
     get_product_count.short_description = _('total number of products')
     get_product_count.admin_order_field = 'product_count'
 
     def get_product_for_sale_count(self, instance: Brand):
-        return getattr(instance, 'product_for_sale_count')
+        return instance.for_sale_count
 
     get_product_for_sale_count.short_description \
         = _('number of products for sale')
-    get_product_for_sale_count.admin_order_field = 'product_for_sale_count'
+    get_product_for_sale_count.admin_order_field = 'for_sale_count'
 
 
 class BrandAdmin(_ModelWithProductCount):
@@ -187,5 +176,24 @@ class ProductAdmin(admin.ModelAdmin):
 
     form = Form
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+
+        # warn about products that may have been listed already
+        product = form.instance
+        hashes = [product.main_image_hash] + list(
+            product.images.values_list('image_hash', flat=True))
+        duplicate_pks = find_similar_products(
+            filter(None, hashes), settings.DUPLICATE_IMAGE_DISTANCE,
+            exclude={product.pk})
+        if duplicate_pks:
+            messages.warning(request, format_html(
+                '{} {}', _('Products with almost the same images exist:'),
+                format_html_join(', ', '<a href="{}">#{}</a>', (
+                    (reverse('admin:shop_product_change', args=(pk,)), pk)
+                    for pk in duplicate_pks[:10]
+                ))
+            ))
+
 
 admin.site.register(Product, ProductAdmin)
@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(name):
+    return 'version:' + name
+
+
+def _modified_key(name):
+    return 'modified:' + name
+
+
+def get_version(name):
+    """Get the current value of a version counter."""
+    version = cache.get(_version_key(name))
+    if version is None:
+        # start from a timestamp, so that a counter evicted from the cache
+        # never comes back with a value that has been used before
+        cache.add(_version_key(name), int(time.time() * 1000), None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def bump_version(name):
+    """
+    Change a version counter, making everything keyed on it stale,
+    and return the new value.
+    """
+    try:
+        version = cache.incr(_version_key(name))
+    except ValueError:
+        # the counter doesn't exist yet
+        version = get_version(name)
+    cache.set(_modified_key(name), int(time.time()), None)
+    return version
+
+
+def bump_version_on_commit(name):
+    """
+    Bump a version counter once the current transaction commits,
+    otherwise a concurrent request may see the new version but still read
+    the old rows, and cache them under the new version.
+    """
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def get_last_modified(name):
+    """Get the timestamp (in seconds) of the last change of a version."""
+    modified = cache.get(_modified_key(name))
+    if modified is None:
+        # unknown, assume it just changed
+        cache.add(_modified_key(name), int(time.time()), None)
+        modified = cache.get(_modified_key(name))
+    return modified
+
+
+def normalize_query_string(query_dict, ignored=()):
+    """Make a stable string from a QueryDict, regardless of the param order."""
+    return '&'.join(sorted(
+        '%s=%s' % (k, v)
+        for k, values in query_dict.lists() if k not in ignored
+        for v in values
+    ))
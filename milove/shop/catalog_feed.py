@@ -0,0 +1,106 @@
+"""
+Catalog feed of unsold products for shopping aggregators, as CSV or RSS.
+
+Feeds are generated as iterables of text, reading products chunk by chunk,
+so the memory used doesn't grow with the size of the catalog.
+"""
+
+import csv
+from collections import OrderedDict
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .models.product import Product, Category
+
+FEED_FORMATS = ('csv', 'rss')
+
+FEED_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'rss': 'application/rss+xml; charset=utf-8',
+}
+
+FEED_FIELDS = ('id', 'title', 'brand', 'category', 'condition',
+               'price', 'original_price', 'image_link')
+
+
+def _iter_products(chunk_size):
+    # keyset chunks rather than "iterator()", which ignores prefetching
+    queryset = Product.objects.filter(sold=False).select_related(
+        'brand'
+    ).prefetch_related(Prefetch(
+        'categories',
+        queryset=Category.objects.filter(
+            level=settings.DETAIL_CATEGORY_LEVEL
+        ).only('id', 'name', 'full_name')
+    )).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def iter_feed_items(base_url, chunk_size=500):
+    """
+    Yield feed items of all unsold products, as ordered dicts
+    with keys in FEED_FIELDS.
+
+    Image URLs are made absolute by joining them with "base_url".
+    """
+    for product in _iter_products(chunk_size):
+        yield OrderedDict((
+            ('id', product.pk),
+            ('title', product.brand.name
+             + (' ' + product.name if product.name else '')),
+            ('brand', product.brand.name),
+            # same as the categories column of the admin
+            ('category', ', '.join(map(str, product.categories.all()))),
+            ('condition', str(product.get_condition_display())),
+            ('price', product.price),
+            ('original_price', product.original_price),
+            ('image_link', urljoin(base_url, product.main_image.url)
+             if product.main_image else ''),
+        ))
+
+
+class _Echo(object):
+    """A file-like object that returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_feed(base_url, chunk_size=500):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FEED_FIELDS)
+    for item in iter_feed_items(base_url, chunk_size):
+        yield writer.writerow(item.values())
+
+
+def iter_rss_feed(base_url, chunk_size=500):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n' \
+          '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n' \
+          '<channel>\n' \
+          '<title>Milove</title>\n' \
+          '<link>%s</link>\n' \
+          '<lastBuildDate>%s</lastBuildDate>\n' \
+          % (escape(base_url), http_date(timezone.now().timestamp()))
+    for item in iter_feed_items(base_url, chunk_size):
+        yield '<item>\n%s</item>\n' % ''.join(
+            '<g:%s>%s</g:%s>\n' % (key, escape(str(value)), key)
+            for key, value in item.items())
+    yield '</channel>\n</rss>\n'
+
+
+def iter_feed(feed_format, base_url, chunk_size=500):
+    """Iterate over text pieces of the feed in the given format."""
+    if feed_format == 'rss':
+        return iter_rss_feed(base_url, chunk_size)
+    return iter_csv_feed(base_url, chunk_size)
@@ -0,0 +1,276 @@
+"""
+Read-only catalog snapshot shared by all worker processes
+
+The snapshot is a file holding the brand list, the category tree, the
+homepage products and the representation (card) of every product, built
+by "buildcatalogsnapshot" or in the background after catalog changes.
+Workers map the file into memory, so its pages are shared between them
+through the OS page cache, and a card lookup is a binary search over an
+array of product ids plus one slice of the mapping.
+
+Layout, little-endian, arrays aligned to 8 bytes:
+
+    header        see HEADER
+    cards         JSON of product representations, one after another
+    brands        JSON of the brand list
+    tree          JSON of the category tree
+    homepage      uint32 product ids
+    ids           uint32 product ids, ascending
+    row versions  uint32, "Product.row_version" of each card
+    offsets       uint64, offset of each card
+    lengths       uint32, length of each card
+
+A new snapshot is written to a temporary file then renamed over the old
+one, workers notice the change of the file and map the new one. Only one
+process rebuilds at a time, holding a lock in the cache, and cards of
+products whose row versions haven't changed are copied from the old
+snapshot, so a rebuild only serializes products changed since.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_utils import get_version
+from .thread_pool import delay_run
+
+# the digit follows "REPRESENTATION_VERSION" of the product serializers,
+# so that snapshots with cards of an old format are ignored
+MAGIC = b'MLVSNAP3'
+
+# magic, catalog version, number of products, number of homepage products,
+# then offset and length of "brands" and "tree", then offsets of arrays:
+# "homepage", "ids", "row versions", "offsets", "lengths"
+HEADER = struct.Struct('<8sQQQ' + 'QQ' * 2 + 'Q' * 5)
+
+REBUILD_LOCK_KEY = 'catalog_snapshot_rebuild_lock'
+# builds in a row before giving up catching up with a busy catalog
+MAX_REBUILDS = 3
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _loads(buffer):
+    return json.loads(bytes(buffer).decode('utf-8'),
+                      object_pairs_hook=OrderedDict)
+
+
+class CatalogSnapshot(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        (magic, self.version, count, homepage_count,
+         brands_offset, brands_length, tree_offset, tree_length,
+         homepage_offset, ids_offset, row_versions_offset,
+         offsets_offset, lengths_offset) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Not a catalog snapshot: %s' % path)
+
+        def array_view(offset, length, typecode):
+            size = struct.calcsize(typecode)
+            return view[offset:offset + length * size].cast(typecode)
+
+        self._view = view
+        self._brands = view[brands_offset:brands_offset + brands_length]
+        self._tree = view[tree_offset:tree_offset + tree_length]
+        self._homepage = array_view(homepage_offset, homepage_count, 'I')
+        self._ids = array_view(ids_offset, count, 'I')
+        self._row_versions = array_view(row_versions_offset, count, 'I')
+        self._offsets = array_view(offsets_offset, count, 'Q')
+        self._lengths = array_view(lengths_offset, count, 'I')
+
+    def brands(self):
+        return _loads(self._brands)
+
+    def category_tree(self):
+        return _loads(self._tree)
+
+    def homepage_ids(self, count):
+        return list(self._homepage[:count])
+
+    def get_raw_card(self, pk, row_version=None):
+        """Same as "get_card", but return the encoded JSON."""
+        i = bisect_left(self._ids, pk)
+        if i == len(self._ids) or self._ids[i] != pk:
+            return None
+        if row_version is not None and self._row_versions[i] != row_version:
+            return None
+        offset = self._offsets[i]
+        return self._view[offset:offset + self._lengths[i]]
+
+    def get_card(self, pk, row_version=None):
+        """
+        Get the representation of a product, or None if it's not in
+        the snapshot, or it's not of the given row version.
+        """
+        card = self.get_raw_card(pk, row_version)
+        return None if card is None else _loads(card)
+
+
+def _align(f):
+    padding = -f.tell() % 8
+    f.write(b'\0' * padding)
+    return f.tell()
+
+
+def build_snapshot(path=None, chunk_size=500):
+    """
+    Build a snapshot of the current catalog, reusing cards of the current
+    snapshot still of the same row versions, return the catalog version.
+    """
+    from .models.product import Brand, Category, Product
+    from .serializers.product import (
+        BrandSerializer,
+        ProductSerializer,
+        represent_product
+    )
+    from .views.product import _build_category_tree
+
+    path = path or settings.CATALOG_SNAPSHOT_PATH
+    # read before the data, versions are bumped after changes commit,
+    # so anything committed later makes the snapshot stale
+    version = get_version('catalog')
+
+    brands = _dumps(BrandSerializer(Brand.objects.order_by('name'),
+                                    many=True).data)
+    tree = _dumps(_build_category_tree(list(Category.objects.filter(
+        super_category=None).values_list('pk', flat=True))))
+    homepage = array('I', Product.objects.filter(sold=False).order_by(
+        '-show_on_homepage').values_list(
+        'pk', flat=True)[:settings.MAX_PRODUCTS_ON_HOMEPAGE])
+    rows = list(Product.objects.order_by('pk').values_list(
+        'pk', 'row_version'))
+    previous = get_snapshot()
+
+    ids = array('I')
+    row_versions = array('I')
+    offsets = array('Q')
+    lengths = array('I')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                cards = {}
+                if previous is not None:
+                    for pk, row_version in chunk:
+                        card = previous.get_raw_card(pk, row_version)
+                        if card is not None:
+                            cards[pk] = (row_version, card)
+                changed = [pk for pk, _ in chunk if pk not in cards]
+                if changed:
+                    for product in ProductSerializer.setup_eager_loading(
+                            Product.objects.filter(pk__in=changed)):
+                        cards[product.pk] = (
+                            product.row_version,
+                            _dumps(represent_product(product)))
+                # deleted meanwhile if missing
+                for pk in sorted(cards):
+                    row_version, card = cards[pk]
+                    ids.append(pk)
+                    row_versions.append(row_version)
+                    offsets.append(f.tell())
+                    lengths.append(len(card))
+                    f.write(card)
+
+            sections = []
+            for data in (brands, tree):
+                sections += [f.tell(), len(data)]
+                f.write(data)
+            for data in (homepage, ids, row_versions, offsets, lengths):
+                sections.append(_align(f))
+                f.write(data.tobytes())
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, version, len(ids), len(homepage),
+                                *sections))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return version
+
+
+_snapshot = None
+_snapshot_stat = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Get the latest snapshot, mapped once per file, or None if none."""
+    global _snapshot, _snapshot_stat
+    try:
+        st = os.stat(settings.CATALOG_SNAPSHOT_PATH)
+    except (OSError, TypeError):
+        return None
+    stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if stat != _snapshot_stat:
+        with _snapshot_lock:
+            if stat != _snapshot_stat:
+                try:
+                    _snapshot = CatalogSnapshot(
+                        settings.CATALOG_SNAPSHOT_PATH)
+                except (OSError, ValueError, struct.error):
+                    _snapshot = None
+                # mappings in use stay valid after the file is replaced
+                _snapshot_stat = stat
+    return _snapshot
+
+
+def get_current_snapshot():
+    """Get the snapshot only if the catalog hasn't changed since it's built."""
+    snapshot = get_snapshot()
+    if snapshot is not None and snapshot.version == get_version('catalog'):
+        return snapshot
+    return None
+
+
+_rebuild_scheduled = threading.Event()
+
+
+def _rebuild_if_stale():
+    _rebuild_scheduled.clear()
+    snapshot = get_snapshot()
+    if snapshot is not None and snapshot.version == get_version('catalog'):
+        return
+    if not cache.add(REBUILD_LOCK_KEY, True,
+                     settings.CATALOG_SNAPSHOT_REBUILD_TIMEOUT):
+        # some other process is rebuilding, check again after it's done
+        schedule_rebuild()
+        return
+    try:
+        for _ in range(MAX_REBUILDS):
+            # changes committed during the build make it stale at once
+            if build_snapshot() == get_version('catalog'):
+                return
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+    schedule_rebuild()
+
+
+def schedule_rebuild():
+    """
+    Rebuild the snapshot a little later if it's stale, so that a burst of
+    changes only causes one rebuild, by whichever process gets there first.
+    """
+    if settings.CATALOG_SNAPSHOT_PATH and not _rebuild_scheduled.is_set():
+        _rebuild_scheduled.set()
+        delay_run(settings.CATALOG_SNAPSHOT_REBUILD_DELAY, _rebuild_if_stale)
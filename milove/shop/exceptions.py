@@ -11,3 +11,8 @@ class PaymentMethodCheckFailed(exceptions.APIException):
 class PaymentFailed(exceptions.APIException):
     status_code = status.HTTP_402_PAYMENT_REQUIRED
     default_detail = _('The payment is failed.')
+
+
+class UploadOffsetMismatch(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('The chunk doesn\'t start at the offset of the upload.')
@@ -1,3 +1,74 @@
-from django.core.files.storage import DefaultStorage
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import DefaultStorage, FileSystemStorage
+from django.utils.deconstruct import deconstructible
 
 storage = DefaultStorage()
+
+BLOB_DIR = 'blobs'
+
+
+def blob_name(hexdigest, ext=''):
+    """
+    Get the name of a blob, sharded by the first 4 hex digits of its hash,
+    so that no directory holds more than a small part of all blobs.
+    """
+    return '%s/%s/%s/%s%s' % (BLOB_DIR, hexdigest[:2], hexdigest[2:4],
+                              hexdigest, ext.lower())
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """Storage naming files by the SHA-256 of their content
+
+    Only the extension of the name given to "save" is kept. Saving a file
+    identical to an existing one returns the name of the existing one,
+    so identical uploads are stored once and referenced by the same name,
+    which means a blob may be shared and is never deleted or moved here.
+    Blobs no longer referenced are reclaimed by the "sweepblobs" command,
+    which spares recently saved ones, as they may not be referenced yet.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(name):
+            # saved again, spare it from sweeping as if it's new
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.blob-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            # a blob saved at the same time has the same content,
+            # replacing it is harmless
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def delete(self, name):
+        # may be referenced by other objects
+        pass
+
+
+blob_storage = BlobStorage()
@@ -0,0 +1,208 @@
+"""
+Visually similar product images
+
+Main images and extra images of products are indexed by their difference
+hashes in a BK-tree, a metric tree over the hamming distance, so finding
+hashes within a small distance only visits a small part of the tree.
+
+Like "suggest.py", every worker process keeps its own index, updates it in
+place on saves in this process, and rebuilds it in the background when the
+"image_hash" version counter tells that some other process changed images,
+serving the stale index until the new one replaces it.
+"""
+
+import threading
+
+from django.db import transaction
+
+from .cache_utils import get_version, bump_version
+from .image_utils import hamming_distance
+from .thread_pool import async_run
+
+SOURCE_MAIN = 'main'  # "Product.main_image", keyed by the product pk
+SOURCE_EXTRA = 'extra'  # "ProductImage", keyed by the product image pk
+
+
+class BKTree(object):
+    """
+    BK-tree of integer hashes, a node is [hash, items, children],
+    where children are keyed by their distances to the node.
+    """
+
+    def __init__(self):
+        self._root = None
+
+    def add(self, value: int, item):
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance):
+        """Yield (distance, hash, item) of items within "max_distance"."""
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                for item in node[1]:
+                    yield distance, node[0], item
+            # triangle inequality rules out all other children
+            for child_distance, child in node[2].items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+
+
+class ImageHashIndex(object):
+    """
+    Items are (source, pk) pairs. Items removed or changed stay in the tree
+    until the next rebuild, but are skipped by comparing with their current
+    hashes.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._tree = BKTree()
+        self._items = {}  # item -> (hash, product pk)
+        self._lock = threading.Lock()
+
+    def _set_item(self, item, value, product_id):
+        if value is None:
+            self._items.pop(item, None)
+        elif self._items.get(item, (None,))[0] != value:
+            self._items[item] = (value, product_id)
+            self._tree.add(value, item)
+
+    def set_item(self, item, hex_hash, product_id):
+        """Set the hash of an item, an empty hash removes it."""
+        with self._lock:
+            self._set_item(item, int(hex_hash, 16) if hex_hash else None,
+                           product_id)
+
+    def rebuild(self, items, version):
+        """Rebuild from an iterable of (item, hex hash, product pk)."""
+        tree = BKTree()
+        current = {}
+        for item, hex_hash, product_id in items:
+            if hex_hash:
+                value = int(hex_hash, 16)
+                current[item] = (value, product_id)
+                tree.add(value, item)
+        with self._lock:
+            self._tree = tree
+            self._items = current
+            self.version = version
+
+    def search(self, hex_hash, max_distance):
+        """
+        Find products with any image within "max_distance" of the hash,
+        return a dict of product pk -> the smallest distance.
+        """
+        if not hex_hash:
+            return {}
+        value = int(hex_hash, 16)
+        products = {}
+        with self._lock:
+            for distance, item_value, item in self._tree.search(
+                    value, max_distance):
+                current = self._items.get(item)
+                if current is None or current[0] != item_value:
+                    # removed, or changed since added to the tree
+                    continue
+                product_id = current[1]
+                if distance < products.get(product_id, distance + 1):
+                    products[product_id] = distance
+        return products
+
+
+_index = ImageHashIndex()
+_rebuild_lock = threading.Lock()
+
+
+def _iter_all_items():
+    from .models.product import Product, ProductImage
+
+    for pk, hex_hash in Product.objects.exclude(
+            main_image_hash='').values_list('pk', 'main_image_hash'):
+        yield (SOURCE_MAIN, pk), hex_hash, pk
+    for pk, hex_hash, product_id in ProductImage.objects.exclude(
+            image_hash='').values_list('pk', 'image_hash', 'product_id'):
+        yield (SOURCE_EXTRA, pk), hex_hash, product_id
+
+
+def _rebuild():
+    global _index
+    try:
+        # read before the data, so changes made meanwhile make it stale
+        version = get_version('image_hash')
+        index = ImageHashIndex()
+        index.rebuild(_iter_all_items(), version)
+        _index = index
+    finally:
+        _rebuild_lock.release()
+
+
+def get_image_hash_index():
+    """
+    Get the index of this process. A stale index is returned as is, and
+    rebuilt in the background, except that the first build is waited for.
+    """
+    version = get_version('image_hash')
+    if _index.version is None:
+        _rebuild_lock.acquire()
+        if _index.version is None:
+            _rebuild()
+        else:
+            _rebuild_lock.release()
+    elif _index.version != version and _rebuild_lock.acquire(blocking=False):
+        # one rebuild at a time, which releases the lock when done
+        async_run(_rebuild)
+    return _index
+
+
+def find_similar_products(hex_hashes, max_distance, exclude=()):
+    """
+    Find products with images similar to any of the hashes,
+    return a list of product pks, the most similar first.
+    """
+    index = get_image_hash_index()
+    distances = {}
+    for hex_hash in hex_hashes:
+        for pk, distance in index.search(hex_hash, max_distance).items():
+            if pk not in exclude \
+                    and distance < distances.get(pk, max_distance + 1):
+                distances[pk] = distance
+    return sorted(distances, key=lambda pk: (distances[pk], pk))
+
+
+def image_changed(source, pk, hex_hash, product_id):
+    """
+    Update the index after the current transaction commits,
+    with the new hash of an image, or an empty hash if it's deleted.
+    """
+
+    def apply():
+        index = _index
+        old_version = index.version
+        version = bump_version('image_hash')
+        if old_version is None:
+            # never built in this process, nothing to update
+            return
+        index.set_item((source, pk), hex_hash, product_id)
+        if version == old_version + 1:
+            # no one else changed anything since the index was built
+            index.version = version
+
+    transaction.on_commit(apply)
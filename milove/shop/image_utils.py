@@ -1,10 +1,23 @@
+import logging
 import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
 from imagekit import ImageSpec
-from imagekit.cachefiles import ImageCacheFile
-from imagekit.processors import ResizeToFill
+from imagekit.processors import ResizeToFill, ResizeToFit
+from pilkit.processors import ProcessorPipeline
+from pilkit.utils import save_image
 
 from .file_storage import storage
+from .thread_pool import async_run
+
+logger = logging.getLogger(__name__)
 
 
 class ThumbnailSmall(ImageSpec):
@@ -19,23 +32,324 @@ class ThumbnailMedium(ImageSpec):
     options = {'quality': 100}
 
 
-def make_image_preview_tag(image_path, spec=ThumbnailSmall, width=120,
-                           link_to_full=True):
-    tag = '<img src="{preview}" width="{width}" />'
-    if link_to_full:
-        tag = '<a href="{full}" target="_blank">' + tag + '</a>'
+# specs generated for every image in the background, see "schedule_thumbnails"
+THUMBNAIL_SPECS = (ThumbnailSmall, ThumbnailMedium)
+
+# shown while the thumbnail of an image is being generated
+THUMBNAIL_PLACEHOLDER = 'placeholders/120x120.png'
+
+
+def get_thumbnail_name(image_path, spec):
+    """Get the name of a thumbnail, by opening but not decoding the image."""
     with storage.open(image_path, 'rb') as f:
         cache_generator = spec(f)
-        cachefile_name = '/'.join((
+        return '/'.join((
             'CACHE/images',
             str(image_path),
             os.path.split(cache_generator.cachefile_name)[-1]
         ))
-        cached = ImageCacheFile(cache_generator, name=cachefile_name)
-        cached.generate()
-        tag = tag.format(
-            full=storage.url(image_path),
-            preview=cached.url,
-            width=width
-        )
-    return tag
+
+
+def get_thumbnail_url(image_path, spec=ThumbnailSmall):
+    """Get the url of a thumbnail, or None if it's not generated yet."""
+    try:
+        name = get_thumbnail_name(image_path, spec)
+    except (IOError, OSError):
+        return None
+    return storage.url(name) if storage.exists(name) else None
+
+
+# responsive renditions of product images, for clients to pick the smallest
+# adequate one, e.g. by "srcset", changing these changes the representation
+# of products, see "REPRESENTATION_VERSION" of the product serializers
+VARIANT_WIDTHS = (360, 720, 1080)
+VARIANT_FORMATS = OrderedDict((
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+))
+
+
+def _make_variant_spec(width, image_format):
+    return type('Variant%s%s' % (image_format.title(), width), (ImageSpec,), {
+        # a narrower image is kept as it is, only re-encoded
+        'processors': [ResizeToFit(width=width, upscale=False)],
+        'format': image_format,
+        'options': {'quality': 80},
+    })
+
+
+_VARIANT_SPECS = OrderedDict(
+    ((ext, width), _make_variant_spec(width, image_format))
+    for ext, image_format in VARIANT_FORMATS.items()
+    for width in VARIANT_WIDTHS
+)
+
+
+def is_placeholder(image_path):
+    return not image_path or image_path.startswith('placeholders/')
+
+
+def get_variant_widths(image_path):
+    """
+    Get widths of the variants an image should have, those no wider than
+    the image, since it's never upscaled, by opening but not decoding it.
+    """
+    with storage.open(image_path, 'rb') as f:
+        width = Image.open(f).size[0]
+    return [w for w in VARIANT_WIDTHS if w <= width]
+
+
+def get_variant_names(image_path, widths=VARIANT_WIDTHS):
+    """
+    Get names of the variants of an image of the widths, as
+    {format: {width: name}}, which only depend on the name of the image.
+    """
+    return OrderedDict(
+        (ext, OrderedDict(
+            (str(width), 'CACHE/variants/%s/%sw.%s' % (image_path, width, ext))
+            for width in widths))
+        for ext in VARIANT_FORMATS
+    )
+
+
+def _draft_size(processors):
+    """
+    Get the size an image can be drafted to, while still no smaller than
+    what the first processor resizes it to, or None if it's not a resize.
+    """
+    if not processors:
+        return None
+    width = getattr(processors[0], 'width', None)
+    height = getattr(processors[0], 'height', None)
+    if not width and not height:
+        return None
+    return width or 1, height or 1
+
+
+def render_images(source_path, jobs):
+    """
+    Render an image into files by jobs of "get_render_jobs", which runs
+    in a process of the pool, return the number of files rendered.
+
+    The image is decoded once, no smaller than the largest file needs,
+    and every file is rendered from a copy of it.
+    """
+    sizes = [_draft_size(processors) for _, processors, _, _ in jobs]
+    source = Image.open(source_path)
+    if sizes and None not in sizes:
+        # let JPEG decoder downscale by up to 8 times while decoding,
+        # so only a fraction of the pixels are decoded
+        source.draft(source.mode, (max(width for width, _ in sizes),
+                                   max(height for _, height in sizes)))
+    source.load()
+
+    for target_path, processors, image_format, options in jobs:
+        img = ProcessorPipeline(processors).process(source.copy())
+
+        directory = os.path.dirname(target_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.render-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                save_image(img, f, image_format, options or {})
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return len(jobs)
+
+
+def get_render_jobs(image_path, thumbnail_specs=THUMBNAIL_SPECS,
+                    variant_widths=(), force=False):
+    """
+    Get jobs rendering thumbnails, and variants of "variant_widths", of an
+    image for "render_images", skipping files already rendered unless "force".
+    """
+    derivatives = [(get_thumbnail_name(image_path, spec), spec)
+                   for spec in thumbnail_specs]
+    names = get_variant_names(image_path, variant_widths)
+    derivatives += [(names[ext][str(width)], _VARIANT_SPECS[ext, width])
+                    for ext in VARIANT_FORMATS for width in variant_widths]
+    return [(storage.path(name), spec.processors, spec.format, spec.options)
+            for name, spec in derivatives
+            if force or not storage.exists(name)]
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Get the pool of processes rendering images, created on first use."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                settings.IMAGE_RENDER_PROCESSES)
+    return _process_pool
+
+
+def _discard_process_pool(pool):
+    """Discard a broken pool, so that the next render creates a new one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def _render(image_path, **kwargs):
+    """Render files of an image, return whether all are rendered."""
+    pool = None
+    try:
+        jobs = get_render_jobs(image_path, **kwargs)
+        if jobs:
+            pool = get_process_pool()
+            pool.submit(render_images, storage.path(image_path),
+                        jobs).result()
+    except (IOError, OSError, ValueError):
+        # missing or broken image, previews stay placeholders
+        return False
+    except BrokenProcessPool:
+        # a process died, e.g. killed for running out of memory,
+        # which breaks the whole pool
+        logger.exception('Image render pool broken while rendering %s',
+                         image_path)
+        _discard_process_pool(pool)
+        return False
+    return True
+
+
+def generate_thumbnails(image_path, specs=THUMBNAIL_SPECS):
+    """Generate thumbnails of an image which are not generated yet."""
+    _render(image_path, thumbnail_specs=specs)
+
+
+def generate_variants(image_path):
+    """
+    Generate variants of an image which are not generated yet, then record
+    them, so that only variants generated are in product representations.
+    """
+    try:
+        widths = get_variant_widths(image_path)
+    except (IOError, OSError, ValueError):
+        return
+    if _render(image_path, thumbnail_specs=(), variant_widths=widths):
+        from .models.product import record_image_variants
+        record_image_variants(image_path, widths)
+
+
+_pending_jobs = set()
+_pending_lock = threading.Lock()
+
+
+def _run_job(key, func, *args):
+    try:
+        func(*args)
+    finally:
+        with _pending_lock:
+            _pending_jobs.discard(key)
+
+
+def _schedule(func, image_paths, *args):
+    """
+    Run "func(image_path, *args)" of each image in the thread pool,
+    after the current transaction commits, an image already scheduled
+    for the function is skipped.
+    """
+
+    def submit():
+        for image_path in image_paths:
+            key = (func, image_path)
+            with _pending_lock:
+                if key in _pending_jobs:
+                    continue
+                _pending_jobs.add(key)
+            async_run(_run_job, key, func, image_path, *args)
+
+    transaction.on_commit(submit)
+
+
+def schedule_thumbnails(image_paths, specs=THUMBNAIL_SPECS):
+    """Generate thumbnails of images in the background."""
+    _schedule(generate_thumbnails, image_paths, specs)
+
+
+def schedule_variants(image_paths):
+    """Generate variants of images in the background."""
+    _schedule(generate_variants,
+              [name for name in image_paths if not is_placeholder(name)])
+
+
+def make_image_preview_tag(image_path, spec=ThumbnailSmall, width=120,
+                           link_to_full=True):
+    tag = '<img src="{preview}" width="{width}" />'
+    if link_to_full:
+        tag = '<a href="{full}" target="_blank">' + tag + '</a>'
+    preview = get_thumbnail_url(image_path, spec)
+    if preview is None:
+        # never generate thumbnails while rendering pages
+        schedule_thumbnails([image_path], THUMBNAIL_SPECS
+                            if spec in THUMBNAIL_SPECS
+                            else THUMBNAIL_SPECS + (spec,))
+        preview = storage.url(THUMBNAIL_PLACEHOLDER)
+    return tag.format(
+        full=storage.url(image_path),
+        preview=preview,
+        width=width
+    )
+
+
+# number of leading bytes "sniff_image_format" needs
+IMAGE_HEADER_SIZE = 12
+
+
+def sniff_image_format(header):
+    """
+    Get the format of an image by its leading bytes,
+    or None if it's not of a format accepted for uploads.
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+DHASH_SIZE = 8  # a hash has DHASH_SIZE ** 2 bits
+
+
+def dhash(image_path, size=DHASH_SIZE):
+    """
+    Compute the difference hash of an image, as a hex string,
+    or None if the image can't be read.
+
+    Similar images have hashes with small hamming distances.
+    """
+    try:
+        with storage.open(image_path, 'rb') as f:
+            img = Image.open(f)
+            # let JPEG decoder downscale, which is much faster
+            img.draft('L', (size * 8, size * 8))
+            img = img.convert('L').resize((size + 1, size), Image.LANCZOS)
+            pixels = list(img.getdata())
+    except (IOError, OSError, ValueError):
+        return None
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return '%0*x' % (size * size // 4, value)
+
+
+def hamming_distance(a: int, b: int):
+    return bin(a ^ b).count('1')
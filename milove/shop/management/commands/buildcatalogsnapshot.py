@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from milove.shop.cache_utils import get_version
+from milove.shop.catalog_snapshot import build_snapshot, get_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Build the read-only catalog snapshot shared by all workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='only build if the catalog has changed '
+                                 'since the current snapshot was built')
+
+    def handle(self, *args, **options):
+        if not settings.CATALOG_SNAPSHOT_PATH:
+            raise CommandError('CATALOG_SNAPSHOT_PATH is not set.')
+
+        if options['if_stale']:
+            snapshot = get_snapshot()
+            if snapshot is not None \
+                    and snapshot.version == get_version('catalog'):
+                self.stdout.write('Catalog snapshot is up to date.')
+                return
+
+        version = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully built catalog snapshot of version %s.' % version))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from milove.shop.image_utils import generate_variants, is_placeholder
+from milove.shop.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive variants of all product images ' \
+           'which are not generated yet, and record them in products.'
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.values_list('main_image', flat=True))
+        names.update(ProductImage.objects.values_list('image', flat=True))
+        names = sorted(name for name in names if not is_placeholder(name))
+        for i, name in enumerate(names, 1):
+            generate_variants(name)
+            if i % 100 == 0:
+                self.stdout.write('%s/%s images done.' % (i, len(names)))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully generated variants of %s images.' % len(names)))
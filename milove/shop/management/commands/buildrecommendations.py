@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from milove.shop.recommendation import rebuild_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product similarity index used by recommendations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', '--neighbours', type=int,
+                            help='number of neighbours of each product')
+
+    def handle(self, *args, **options):
+        count = rebuild_neighbours(options['neighbours'])
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully built %s product neighbours.' % count))
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from milove.shop.catalog_feed import FEED_FORMATS, iter_feed
+
+
+class Command(BaseCommand):
+    help = 'Export unsold products as a CSV or RSS feed ' \
+           'for shopping aggregators.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url',
+                            help='base URL of the site, '
+                                 'e.g. https://www.example.com/')
+        parser.add_argument('-t', '--type', choices=FEED_FORMATS,
+                            default=FEED_FORMATS[0], help='feed format')
+        parser.add_argument('-o', '--output',
+                            help='output file, defaults to stdout')
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', encoding='utf-8', newline='') \
+            if options['output'] else sys.stdout
+        try:
+            for piece in iter_feed(options['type'], options['base_url']):
+                output.write(piece)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if output is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(
+                'Successfully exported catalog feed to %s.'
+                % options['output']))
@@ -1,14 +1,13 @@
 import os
 import json
 import random
-import hashlib
-import shutil
 
+from django.core.files import File
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from milove.shop.models import *
-from milove.shop.file_storage import storage
+from milove.shop.file_storage import blob_storage
 
 
 class Command(BaseCommand):
@@ -76,32 +75,14 @@ class Command(BaseCommand):
 
             # images
 
-            counter = 1
-
-            def move_image_file(p, image_file):
+            def save_image_file(image_file):
                 image_file = image_file.replace('/', os.path.sep)
-                filename, ext = os.path.splitext(image_file)
-                date_str = p.published_dt.strftime('%Y%m%d')
-                filename_hash = hashlib.md5()
-                filename_hash.update(filename.encode('utf-8'))
-                filename_hash.update(date_str.encode('utf-8'))
-                new_dir = 'products/%s/' % p.pk
-                os.makedirs(storage.path(new_dir), exist_ok=True)
-                new_image_file = new_dir + '{}{:02d}-{}{}'.format(
-                    date_str, counter,
-                    filename_hash.hexdigest(),
-                    ext
-                )
-                # os.rename(os.path.join(uploads_dir, image_file),
-                #           storage.path(new_image_file))
-                shutil.copyfile(os.path.join(uploads_dir, image_file),
-                                storage.path(new_image_file))
-                return new_image_file
+                with open(os.path.join(uploads_dir, image_file), 'rb') as f:
+                    return blob_storage.save(image_file, File(f))
 
             images = [prod['main_image']] + prod.get('images', [])
             for i, img in enumerate(images):
-                images[i] = move_image_file(product, img[len('uploads/'):])
-                counter += 1
+                images[i] = save_image_file(img[len('uploads/'):])
             product.main_image = images[0]
             for img in images[1:]:
                 ProductImage.objects.create(
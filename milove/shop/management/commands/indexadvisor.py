@@ -0,0 +1,128 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from milove.shop.models.coupon import Coupon
+from milove.shop.models.order import Order
+from milove.shop.models.payment import Payment, PaymentMethod
+from milove.shop.models.product import Product, Category
+from milove.shop.models.sell_request import SellRequest
+
+FULL_SCAN = 'FULL SCAN'
+SORT = 'SORT'
+
+
+def _hot_queries():
+    """
+    Querysets equivalent to the ones issued on the hot paths of the shop,
+    as (name, queryset) pairs. Parameters are placeholders, only the shape
+    of the queries matters to the planner.
+    """
+    now = timezone.now()
+    return [
+        ('product list',
+         Product.objects.order_by('sold', '-published_dt', '-id')[:20]),
+        ('product list (keyset page)',
+         Product.objects.filter(sold=False, published_dt__lt=now)
+         .order_by('sold', '-published_dt', '-id')[:20]),
+        ('homepage products',
+         Product.objects.filter(sold=False)
+         .order_by('-show_on_homepage')[:9]),
+        ('product by serial code',
+         Product.objects.filter(serial_code='0')),
+        ('hot categories',
+         Category.objects.filter(level=3).order_by('-product_count')[:10]),
+        ('order list of user',
+         Order.objects.filter(user_id=0).order_by('-created_dt')[:20]),
+        ('unpaid orders to close',
+         Order.objects.filter(status=Order.STATUS_UNPAID, created_dt__lt=now)),
+        ('payment execution',
+         Payment.objects.filter(user_id=0, status=Payment.STATUS_PENDING,
+                                method=PaymentMethod.PAYPAL,
+                                vendor_payment_id='0')),
+        ('valuated sell requests to close',
+         SellRequest.objects.filter(status=SellRequest.STATUS_VALUATED,
+                                    valuated_dt__lt=now)),
+        ('coupon by code',
+         Coupon.objects.filter(code='0', is_valid=True)[:1]),
+    ]
+
+
+def _explain(queryset):
+    """
+    Run EXPLAIN on the queryset, return the plan as a list of lines
+    and a list of findings in the plan, i.e. full table scans and sorts
+    not served by an index.
+    """
+    sql, params = queryset.query.sql_with_params()
+    vendor = connection.vendor
+    findings = []
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            # rows are (id, parent, notused, detail), a full table scan
+            # looks like "SCAN TABLE shop_product" or "SCAN shop_product",
+            # a sort like "USE TEMP B-TREE FOR ORDER BY"
+            details = [row[-1] for row in cursor.fetchall()]
+            if any(d.startswith('SCAN') and 'USING' not in d
+                   for d in details):
+                findings.append(FULL_SCAN)
+            if any('USE TEMP B-TREE' in d for d in details):
+                findings.append(SORT)
+            return details, findings
+
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    if vendor == 'mysql':
+        lines = ['%s: type=%s key=%s rows=%s extra=%s' % (
+            row.get('table'), row.get('type'), row.get('key'),
+            row.get('rows'), row.get('Extra')) for row in rows]
+        if any(row.get('type') == 'ALL' for row in rows):
+            findings.append(FULL_SCAN)
+        if any('Using filesort' in (row.get('Extra') or '') for row in rows):
+            findings.append(SORT)
+    elif vendor == 'postgresql':
+        lines = [row['QUERY PLAN'] for row in rows]
+        if any('Seq Scan' in line for line in lines):
+            findings.append(FULL_SCAN)
+        if any(re.search(r'\bSort\s+\(', line) for line in lines):
+            findings.append(SORT)
+    else:
+        lines = [' '.join(str(v) for v in row.values()) for row in rows]
+    return lines, findings
+
+
+class Command(BaseCommand):
+    help = 'Explain the hot queries of the shop and report full table ' \
+           'scans and sorts not served by indexes. Note that planners ' \
+           'may prefer scanning tiny tables, so run this against ' \
+           'a database with realistic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help='exit with an error if any full table '
+                                 'scan or sort is found')
+
+    def handle(self, *args, **options):
+        queries = _hot_queries()
+        problems = []
+        for name, queryset in queries:
+            lines, findings = _explain(queryset)
+            style = self.style.WARNING if findings else self.style.SUCCESS
+            self.stdout.write(style('%s%s' % (
+                name, ''.join(' (%s)' % f for f in findings))))
+            for line in lines:
+                self.stdout.write('    %s' % line)
+            if findings:
+                problems.append(name)
+
+        if problems and options['strict']:
+            raise CommandError('Full table scans or sorts found in: %s.'
+                               % ', '.join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully explained %s queries, %s with full table scans '
+            'or sorts.' % (len(queries), len(problems))))
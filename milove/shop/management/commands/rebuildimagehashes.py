@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from milove.shop.cache_utils import bump_version
+from milove.shop.models import Product, ProductImage, compute_image_hash
+
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes of all product images, ' \
+           'used to find similar and duplicate products.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='only compute hashes not computed yet')
+
+    def handle(self, *args, **options):
+        count = 0
+        for model, field, hash_field in (
+                (Product, 'main_image', 'main_image_hash'),
+                (ProductImage, 'image', 'image_hash')):
+            queryset = model.objects.all()
+            if options['missing']:
+                queryset = queryset.filter(**{hash_field: ''})
+            for pk, name, old_hash in queryset.values_list(
+                    'pk', field, hash_field).iterator():
+                new_hash = compute_image_hash(name)
+                if new_hash != old_hash:
+                    # update() doesn't send signals, nothing else changes
+                    model.objects.filter(pk=pk).update(
+                        **{hash_field: new_hash})
+                    count += 1
+
+        # make every process rebuild its index
+        bump_version('image_hash')
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully updated %s image hashes.' % count))
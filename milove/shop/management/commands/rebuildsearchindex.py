@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from milove.shop.models import Product, update_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild search documents of all products.'
+
+    def handle(self, *args, **options):
+        update_search_documents(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully rebuilt search index.'))
@@ -0,0 +1,133 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from milove.shop.file_storage import storage
+from milove.shop.image_utils import (
+    get_render_jobs,
+    get_variant_widths,
+    is_placeholder,
+    render_images
+)
+from milove.shop.models import Product, ProductImage, SellRequest
+from milove.shop.models.product import record_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Render thumbnails and variants of all images in parallel. ' \
+           'Files already rendered are skipped, so an interrupted run ' \
+           'resumes where it stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-j', '--jobs', type=int,
+                            default=os.cpu_count() or 1,
+                            help='number of processes rendering images')
+        parser.add_argument('--force', action='store_true',
+                            help='render files already rendered again')
+        parser.add_argument('--state',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'rebuildthumbnails.state'),
+                            help='file recording images done by a forced '
+                                 'run, for the next forced run to resume')
+
+    @staticmethod
+    def _collect_images():
+        """Get a sorted list of (image name, whether it has variants)."""
+        images = {}
+        for paths in SellRequest.objects.values_list('image_paths',
+                                                     flat=True).iterator():
+            images.update((path, False) for path in paths or [])
+        # product images have variants, even if also in sell requests
+        for model, field in ((Product, 'main_image'), (ProductImage, 'image')):
+            images.update((name, True) for name in model.objects.values_list(
+                field, flat=True).iterator())
+        return sorted((name, variants) for name, variants in images.items()
+                      if not is_placeholder(name))
+
+    def handle(self, *args, **options):
+        force = options['force']
+        state_path = options['state']
+        done = set()
+        if force and os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                done.update(line.rstrip('\n') for line in f)
+            self.stdout.write('Resuming, %s images done before.' % len(done))
+
+        images = [image for image in self._collect_images()
+                  if image[0] not in done]
+        total = len(images)
+        rendered = failed = finished = 0
+        last_report = started = time.time()
+        state = open(state_path, 'a', encoding='utf-8') if force else None
+
+        def report():
+            nonlocal last_report
+            if time.time() - last_report >= 5:
+                last_report = time.time()
+                self.stdout.write(
+                    '%s/%s images, %s files rendered, %s failed, '
+                    '%.1f images/s.' % (finished, total, rendered, failed,
+                                        finished / (last_report - started)))
+
+        def finish(future, name, widths):
+            nonlocal rendered, failed, finished
+            finished += 1
+            try:
+                rendered += future.result()
+            except (IOError, OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write('Failed to render %s: %s' % (name, e))
+            else:
+                if widths is not None:
+                    record_image_variants(name, widths)
+                if state is not None:
+                    state.write(name + '\n')
+                    state.flush()
+            report()
+
+        try:
+            with ProcessPoolExecutor(options['jobs']) as pool:
+                pending = {}
+                for name, variants in images:
+                    try:
+                        widths = get_variant_widths(name) \
+                            if variants else None
+                        jobs = get_render_jobs(name,
+                                               variant_widths=widths or (),
+                                               force=force)
+                    except (IOError, OSError, ValueError):
+                        # missing or broken
+                        finished += 1
+                        continue
+                    if not jobs:
+                        # nothing to render, variants rendered may still
+                        # be unrecorded
+                        if widths is not None:
+                            record_image_variants(name, widths)
+                        finished += 1
+                        continue
+
+                    # keep a bounded number of images queued
+                    while len(pending) >= options['jobs'] * 4:
+                        completed, _ = wait(pending,
+                                            return_when=FIRST_COMPLETED)
+                        for future in completed:
+                            finish(future, *pending.pop(future))
+                    future = pool.submit(render_images, storage.path(name),
+                                         jobs)
+                    pending[future] = name, widths
+
+                for future in list(pending):
+                    finish(future, *pending.pop(future))
+        finally:
+            if state is not None:
+                state.close()
+
+        if force and not failed:
+            os.remove(state_path)
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully rendered %s files of %s images, %s failed.' % (
+                rendered, total, failed)))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from milove.shop.models import recount_product_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount product counters of all brands and categories.'
+
+    def handle(self, *args, **options):
+        recount_product_counters()
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully repaired product counters.'))
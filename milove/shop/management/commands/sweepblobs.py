@@ -0,0 +1,63 @@
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand
+
+from milove.shop.file_storage import BLOB_DIR, blob_storage, storage
+from milove.shop.models import Product, ProductImage, SellRequest
+
+
+class Command(BaseCommand):
+    help = 'Delete blobs not referenced by any product, product image or ' \
+           'sell request, with their thumbnails and variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='hours since a blob is saved before it can '
+                                 'be deleted, uploads are only referenced '
+                                 'after they are saved')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only list blobs to delete')
+
+    @staticmethod
+    def _collect_references():
+        names = set(Product.objects.values_list('main_image', flat=True))
+        names.update(ProductImage.objects.values_list('image', flat=True))
+        names.update(SellRequest.objects.exclude(
+            shipping_label='').exclude(shipping_label=None).values_list(
+            'shipping_label', flat=True))
+        for paths in SellRequest.objects.values_list('image_paths',
+                                                     flat=True).iterator():
+            names.update(paths or [])
+        return names
+
+    def handle(self, *args, **options):
+        # blobs saved from now on are younger than the cutoff
+        cutoff = time.time() - options['min_age'] * 3600
+        referenced = self._collect_references()
+        root = blob_storage.path(BLOB_DIR)
+
+        deleted = size = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = '/'.join((BLOB_DIR, os.path.relpath(
+                    path, root).replace(os.sep, '/')))
+                st = os.stat(path)
+                if name in referenced or st.st_mtime > cutoff:
+                    continue
+                deleted += 1
+                size += st.st_size
+                if options['dry_run']:
+                    self.stdout.write(name)
+                    continue
+                os.remove(path)
+                for derived in ('CACHE/images', 'CACHE/variants'):
+                    shutil.rmtree(storage.path('/'.join((derived, name))),
+                                  ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully %s %s unreferenced blobs of %.1f MB.' % (
+                'found' if options['dry_run'] else 'deleted',
+                deleted, size / 1024 / 1024)))
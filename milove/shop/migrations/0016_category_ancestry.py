@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_category_ancestry(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    done = {}
+    for cat in Category.objects.order_by('level', 'pk'):
+        parent = done.get(cat.super_category_id)
+        if parent is None:
+            cat.path = '%s/' % cat.pk
+            cat.full_name = cat.simple_name = cat.name
+        else:
+            cat.path = parent.path + '%s/' % cat.pk
+            cat.full_name = parent.full_name + ' - ' + cat.name
+            root_name = done[int(parent.path.split('/')[0])].name
+            cat.simple_name = root_name + cat.name
+        cat.save(update_fields=('path', 'full_name', 'simple_name'))
+        done[cat.pk] = cat
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_sellrequest_done_dt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='category path'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='full_name',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='category full name'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='simple_name',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='category simple name'),
+        ),
+        migrations.RunPython(fill_category_ancestry,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 10:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+_TABLE = 'shop_productsearchdocument'
+# the trigram tokenizer of FTS5 needs SQLite 3.34, without it there is
+# no full-text index, and "search.py" falls back to scanning documents
+_SQLITE_TRIGRAM_VERSION = (3, 34, 0)
+_FTS5_TABLE = _TABLE + '_fts'
+
+_SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE {fts} USING fts5("
+    "text, content='{table}', content_rowid='product_id', "
+    "tokenize='trigram')",
+    "CREATE TRIGGER {table}_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.product_id, new.text); "
+    "END",
+    "CREATE TRIGGER {table}_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) "
+    "VALUES ('delete', old.product_id, old.text); "
+    "END",
+    "CREATE TRIGGER {table}_au AFTER UPDATE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) "
+    "VALUES ('delete', old.product_id, old.text); "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.product_id, new.text); "
+    "END",
+]
+_SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS {table}_ai',
+    'DROP TRIGGER IF EXISTS {table}_ad',
+    'DROP TRIGGER IF EXISTS {table}_au',
+    'DROP TABLE IF EXISTS {fts}',
+]
+_MYSQL_CREATE = [
+    'ALTER TABLE {table} ADD FULLTEXT INDEX {table}_text_ft (text) '
+    'WITH PARSER ngram',
+]
+_MYSQL_DROP = [
+    'ALTER TABLE {table} DROP INDEX {table}_text_ft',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql.format(table=_TABLE, fts=_FTS5_TABLE))
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        database = schema_editor.connection.Database
+        if database.sqlite_version_info >= _SQLITE_TRIGRAM_VERSION:
+            _run(schema_editor, _SQLITE_CREATE)
+    elif vendor == 'mysql':
+        _run(schema_editor, _MYSQL_CREATE)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, _SQLITE_DROP)
+    elif vendor == 'mysql':
+        _run(schema_editor, _MYSQL_DROP)
+
+
+def fill_search_documents(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSearchDocument = apps.get_model('shop', 'ProductSearchDocument')
+    docs = []
+    for prod in Product.objects.select_related(
+            'brand').prefetch_related('categories'):
+        parts = [prod.brand.name, prod.name, prod.style, prod.size]
+        parts += [cat.name for cat in prod.categories.all()]
+        parts.append(prod.description)
+        docs.append(ProductSearchDocument(product_id=prod.pk,
+                                          text='\n'.join(filter(None, parts))))
+    ProductSearchDocument.objects.bulk_create(docs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_category_ancestry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='shop.Product', verbose_name='product')),
+                ('text', models.TextField(blank=True, verbose_name='text')),
+            ],
+            options={
+                'verbose_name': 'product search document',
+                'verbose_name_plural': 'product search documents',
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(fill_search_documents,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 11:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_productsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbour',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='similarity score')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.Product', verbose_name='neighbour')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='shop.Product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'product neighbour',
+                'verbose_name_plural': 'product neighbours',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='productneighbour',
+            unique_together=set([('product', 'neighbour')]),
+        ),
+    ]
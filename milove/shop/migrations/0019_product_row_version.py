@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 13:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_productneighbour'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Product|row version'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 14:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count_products(apps, schema_editor):
+    for model_name in ('Brand', 'Category'):
+        model = apps.get_model('shop', model_name)
+        for obj in model.objects.annotate(
+                counted=models.Count('products'),
+                counted_for_sale=models.Sum(models.Case(
+                    models.When(products__sold=False, then=1),
+                    default=0,
+                    output_field=models.IntegerField()
+                ))):
+            model.objects.filter(pk=obj.pk).update(
+                product_count=obj.counted,
+                for_sale_count=obj.counted_for_sale or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_product_row_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='for_sale_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='number of products for sale'),
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='product_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='total number of products'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='for_sale_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='number of products for sale'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='total number of products'),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
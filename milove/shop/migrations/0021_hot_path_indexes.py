@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 14:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_product_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coupon',
+            name='code',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='Coupon|code'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='serial_code',
+            field=models.CharField(blank=True, db_index=True, max_length=200, verbose_name='Product|serial code'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_dt'], name='shop_order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_dt'], name='shop_order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'status', 'method', 'vendor_payment_id'], name='shop_payment_execution_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sold', 'published_dt', 'id'], name='shop_prod_sold_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sold', 'show_on_homepage'], name='shop_prod_homepage_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellrequest',
+            index=models.Index(fields=['status', 'valuated_dt'], name='shop_sellreq_status_val_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 15:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def record_existing_products(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductChange = apps.get_model('shop', 'ProductChange')
+    ProductChange.objects.bulk_create([
+        ProductChange(product_id=pk, kind='created')
+        for pk in Product.objects.order_by('pk').values_list('pk', flat=True)
+    ], batch_size=500)
+    for change_id, product_id in ProductChange.objects.values_list(
+            'id', 'product_id'):
+        Product.objects.filter(pk=product_id).update(sequence=change_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sequence',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Product|sequence'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_dt',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Product|updated datetime'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='ProductChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('product_id', models.PositiveIntegerField(unique=True, verbose_name='ProductChange|product ID')),
+                ('kind', models.CharField(choices=[('updated', 'ProductChangeKind|updated'), ('sold', 'ProductChangeKind|sold'), ('created', 'ProductChangeKind|created'), ('deleted', 'ProductChangeKind|deleted')], max_length=20, verbose_name='ProductChange|kind')),
+                ('changed_dt', models.DateTimeField(auto_now=True, verbose_name='ProductChange|changed datetime')),
+            ],
+            options={
+                'verbose_name': 'product change',
+                'verbose_name_plural': 'product changes',
+            },
+        ),
+        migrations.RunPython(record_existing_products,
+                             migrations.RunPython.noop),
+    ]
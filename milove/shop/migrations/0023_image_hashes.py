@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 15:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0022_productchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='Product|main image hash'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='image hash'),
+        ),
+    ]
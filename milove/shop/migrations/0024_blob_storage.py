@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import milove.shop.file_storage
+import milove.shop.models.product
+import milove.shop.models.sell_request
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_image_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='main_image',
+            field=models.ImageField(default='placeholders/120x120.png', storage=milove.shop.file_storage.BlobStorage(), upload_to=milove.shop.models.product._prod_image_path, verbose_name='Product|main image'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=milove.shop.file_storage.BlobStorage(), upload_to=milove.shop.models.product._prod_image_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='sellrequest',
+            name='shipping_label',
+            field=models.FileField(blank=True, null=True, storage=milove.shop.file_storage.BlobStorage(), upload_to=milove.shop.models.sell_request._shipping_label_upload_path, verbose_name='shipping label'),
+        ),
+    ]
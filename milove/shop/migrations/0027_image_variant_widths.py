@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 19:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_product_list_index_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image_variant_widths',
+            field=jsonfield.fields.JSONField(blank=True, default=[], editable=False, verbose_name='Product|main image variant widths'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variant_widths',
+            field=jsonfield.fields.JSONField(blank=True, default=[], editable=False, verbose_name='variant widths'),
+        ),
+    ]
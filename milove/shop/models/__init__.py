@@ -8,3 +8,6 @@ from .payment import *
 from .sell_request import *
 from .misc_info import *
 from .withdrawal import *
+from .search import *
+from .recommendation import *
+from .chunked_upload import *
@@ -0,0 +1,48 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+
+from ..file_storage import storage
+
+__all__ = ['ChunkedUpload']
+
+
+class ChunkedUpload(models.Model):
+    """A resumable upload in progress, see "views/chunked_upload.py"
+
+    Chunks are written to the partial file as they arrive,
+    which is saved as a blob when the upload is finalized.
+    """
+
+    class Meta:
+        verbose_name = _('chunked upload')
+        verbose_name_plural = _('chunked uploads')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name='+',
+                             verbose_name=_('user'))
+    filename = models.CharField(_('ChunkedUpload|filename'), max_length=200)
+    size = models.PositiveIntegerField(_('ChunkedUpload|size'))
+    # number of bytes received, always from the start of the file
+    offset = models.PositiveIntegerField(_('ChunkedUpload|offset'),
+                                         default=0)
+    created_dt = models.DateTimeField(_('created datetime'),
+                                      auto_now_add=True, db_index=True)
+
+    @property
+    def partial_name(self):
+        return 'partial_uploads/%s' % self.id.hex
+
+    def __str__(self):
+        return self.filename
+
+
+@receiver(signals.post_delete, sender=ChunkedUpload)
+def chunked_upload_post_delete(instance: ChunkedUpload, **kwargs):
+    storage.delete(instance.partial_name)
@@ -9,7 +9,7 @@ class Coupon(models.Model):
         verbose_name = _('coupon')
         verbose_name_plural = _('coupons')
 
-    code = models.CharField(_('Coupon|code'), max_length=100)
+    code = models.CharField(_('Coupon|code'), max_length=100, db_index=True)
 
     TYPE_RATE = 'rate'
     TYPE_AMOUNT = 'amount'
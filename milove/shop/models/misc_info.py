@@ -1,7 +1,11 @@
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
 from solo.models import SingletonModel
 
+from ..cache_utils import bump_version_on_commit
+
 __all__ = ['MiscInfo']
 
 
@@ -14,3 +18,9 @@ class MiscInfo(SingletonModel):
 
     def __str__(self):
         return 'Misc Information'
+
+
+@receiver(signals.post_save, sender=MiscInfo)
+def misc_info_post_save(**kwargs):
+    # misc information is served along with the catalog
+    bump_version_on_commit('catalog')
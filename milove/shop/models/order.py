@@ -61,6 +61,14 @@ class Order(models.Model):
             ('randomly_switch_order_status',
              'Can randomly switch order status'),
         )
+        indexes = [
+            # order list of a user
+            models.Index(fields=['user', 'created_dt'],
+                         name='shop_order_user_created_idx'),
+            # "closeunpaidorders" command
+            models.Index(fields=['status', 'created_dt'],
+                         name='shop_order_status_created_idx'),
+        ]
 
     # basic information
     created_dt = models.DateTimeField(_('created datetime'), auto_now_add=True)
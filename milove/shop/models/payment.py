@@ -26,6 +26,12 @@ class Payment(models.Model):
     class Meta:
         verbose_name = _('payment')
         verbose_name_plural = _('payments')
+        indexes = [
+            # payment execution and cancellation
+            models.Index(fields=['user', 'status', 'method',
+                                 'vendor_payment_id'],
+                         name='shop_payment_execution_idx'),
+        ]
 
     created_dt = models.DateTimeField(_('created datetime'), auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
@@ -1,18 +1,21 @@
-import os
-import hashlib
+import threading
 
-from django.db import models
-from django.db.models import signals
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, signals
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
+from jsonfield import JSONField
 
 from ..model_utils import get_or_none
-from ..file_storage import storage
+from ..file_storage import blob_storage
+from ..image_utils import dhash, schedule_thumbnails, schedule_variants
+from ..cache_utils import bump_version_on_commit
 
 __all__ = ['Brand', 'Category', 'Attachment',
            'AuthenticationMethod', 'ProductLocation',
-           'ProductImage', 'Product']
+           'ProductImage', 'Product', 'recount_product_counters',
+           'ProductChange', 'compute_image_hash']
 
 
 class Brand(models.Model):
@@ -22,6 +25,14 @@ class Brand(models.Model):
 
     name = models.CharField(_('name'), max_length=200, unique=True)
 
+    # maintained by the signal handlers of Product, see "_add_to_counters"
+    product_count = models.PositiveIntegerField(
+        _('total number of products'), default=0, editable=False,
+        db_index=True)
+    for_sale_count = models.PositiveIntegerField(
+        _('number of products for sale'), default=0, editable=False,
+        db_index=True)
+
     def __str__(self):
         return self.name
 
@@ -38,30 +49,102 @@ class Category(models.Model):
                                        verbose_name=_('super category'))
     level = models.IntegerField(_('category level'), editable=False)
 
+    # maintained by the signal handlers of Product, see "_add_to_counters"
+    product_count = models.PositiveIntegerField(
+        _('total number of products'), default=0, editable=False,
+        db_index=True)
+    for_sale_count = models.PositiveIntegerField(
+        _('number of products for sale'), default=0, editable=False,
+        db_index=True)
+
+    # the following fields materialize the ancestry of a category,
+    # they are maintained by the signal handlers below, never set them by hand
+
+    # primary keys from the top level category down to this one,
+    # each followed by a slash, e.g. "1/5/12/"
+    path = models.CharField(_('category path'), max_length=100,
+                            editable=False, blank=True, db_index=True)
+    full_name = models.CharField(_('category full name'), max_length=255,
+                                 editable=False, blank=True)
+    simple_name = models.CharField(_('category simple name'), max_length=100,
+                                   editable=False, blank=True)
+
     def __str__(self):
-        if not self.super_category:
-            return self.name
-        return str(self.super_category) + ' - ' + str(self.name)
+        return self.full_name or self.name
+
+    @staticmethod
+    def split_path(path):
+        return [int(x) for x in path.split('/') if x]
+
+    def get_ancestor_ids(self):
+        return Category.split_path(self.path)[:-1]
+
+    def get_ancestors(self):
+        return Category.objects.filter(
+            pk__in=self.get_ancestor_ids()).order_by('level')
 
-    def simple_name(self):
-        simple_name = self.name
-        if self.super_category:
-            cat = self.super_category
-            while cat.super_category:
-                cat = cat.super_category
-            # now "cat" is the most top level category
-            simple_name = cat.name + simple_name
-        return simple_name
+    def get_descendants(self):
+        return Category.objects.filter(
+            path__startswith=self.path).exclude(pk=self.pk)
+
+
+def _fill_category_ancestry(cat: Category, parent: Category = None):
+    if parent is None:
+        cat.level = 1
+        cat.full_name = cat.simple_name = cat.name
+        cat.path = '%s/' % cat.pk if cat.pk else ''
+        return
+
+    if parent.super_category_id is None:
+        root_name = parent.name
+    else:
+        # simple name is the top level category's name plus its own name
+        root_name = parent.simple_name[
+                    :len(parent.simple_name) - len(parent.name)]
+    cat.level = parent.level + 1
+    cat.full_name = parent.full_name + ' - ' + cat.name
+    cat.simple_name = root_name + cat.name
+    cat.path = parent.path + '%s/' % cat.pk if cat.pk else ''
 
 
 @receiver(signals.pre_save, sender=Category)
 def category_pre_save(sender, instance: Category, **kwargs):
-    level = 1
-    cat = instance
-    while cat.super_category:
-        level += 1
-        cat = cat.super_category
-    instance.level = level
+    old_path = instance.path
+    _fill_category_ancestry(instance, instance.super_category)
+    # the path is handled in post_save, for a new category has no pk yet
+    instance.path = old_path
+
+
+@receiver(signals.post_save, sender=Category)
+def category_post_save(instance: Category, created, **kwargs):
+    bump_version_on_commit('category')
+
+    old_path = instance.path
+    _fill_category_ancestry(instance, instance.super_category)
+    if instance.path != old_path:
+        Category.objects.filter(pk=instance.pk).update(path=instance.path)
+
+    if created or not old_path:
+        return
+
+    # bring the whole subtree up to date, parents go before children
+    refreshed = {instance.pk: instance}
+    for cat in Category.objects.filter(
+            path__startswith=old_path).exclude(
+            pk=instance.pk).order_by('level'):
+        old_values = (cat.level, cat.path, cat.full_name, cat.simple_name)
+        _fill_category_ancestry(cat, refreshed[cat.super_category_id])
+        new_values = (cat.level, cat.path, cat.full_name, cat.simple_name)
+        if new_values != old_values:
+            Category.objects.filter(pk=cat.pk).update(
+                **dict(zip(('level', 'path', 'full_name', 'simple_name'),
+                           new_values)))
+        refreshed[cat.pk] = cat
+
+
+@receiver(signals.post_delete, sender=Category)
+def category_post_delete(**kwargs):
+    bump_version_on_commit('category')
 
 
 class Attachment(models.Model):
@@ -98,13 +181,8 @@ class ProductLocation(models.Model):
 
 
 def _prod_image_path(_, filename):
-    filename, ext = os.path.splitext(filename)
-    now = timezone.now()
-    filename_hash = hashlib.md5()
-    filename_hash.update(filename.encode('utf-8'))
-    filename_hash.update(str(now.timestamp()).encode('utf-8'))
-    return 'uploads/{}-{}{}'.format(now.strftime('%Y%m%d%H%M%S'),
-                                    filename_hash.hexdigest(), ext)
+    # "blob_storage" names the file by its content, keeping the extension
+    return filename
 
 
 _prod_image_placeholder_path = 'placeholders/120x120.png'
@@ -115,7 +193,14 @@ class ProductImage(models.Model):
         verbose_name = _('product image')
         verbose_name_plural = _('product images')
 
-    image = models.ImageField(_('image'), upload_to=_prod_image_path)
+    image = models.ImageField(_('image'), upload_to=_prod_image_path,
+                              storage=blob_storage)
+    # difference hash of the image, see "image_similarity.py"
+    image_hash = models.CharField(_('image hash'), max_length=16,
+                                  blank=True, editable=False)
+    # widths of the responsive variants generated, see "get_variant_widths"
+    variant_widths = JSONField(_('variant widths'), default=[], blank=True,
+                               editable=False)
     product = models.ForeignKey('Product', on_delete=models.CASCADE,
                                 related_name='images',
                                 verbose_name=_('product'))
@@ -128,6 +213,15 @@ class Product(models.Model):
     class Meta:
         verbose_name = _('product')
         verbose_name_plural = _('products')
+        indexes = [
+            # default ordering of the product list, and keyset pagination,
+            # in the same directions, so no sort is needed
+            models.Index(fields=['sold', '-published_dt', '-id'],
+                         name='shop_prod_sold_published_idx'),
+            # homepage products (unsold, ordered by "show_on_homepage")
+            models.Index(fields=['sold', 'show_on_homepage'],
+                         name='shop_prod_homepage_sold_idx'),
+        ]
 
     published_dt = models.DateTimeField(_('Product|published datetime'),
                                         auto_now_add=True)
@@ -196,7 +290,7 @@ class Product(models.Model):
                                          verbose_name=_('Product|attachments'))
     description = models.TextField(_('Product|description'), blank=True)
     serial_code = models.CharField(_('Product|serial code'),
-                                   max_length=200, blank=True)
+                                   max_length=200, blank=True, db_index=True)
     authentication_methods = models.ManyToManyField(
         'AuthenticationMethod', related_name='products', blank=True,
         verbose_name=_('Product|authentication methods'))
@@ -214,59 +308,507 @@ class Product(models.Model):
 
     main_image = models.ImageField(_('Product|main image'),
                                    default=_prod_image_placeholder_path,
-                                   upload_to=_prod_image_path)
+                                   upload_to=_prod_image_path,
+                                   storage=blob_storage)
+    main_image_hash = models.CharField(_('Product|main image hash'),
+                                       max_length=16, blank=True,
+                                       editable=False)
+    main_image_variant_widths = JSONField(
+        _('Product|main image variant widths'), default=[], blank=True,
+        editable=False)
+
+    # increased whenever the public representation of the product changes,
+    # including changes of its images and related brand, categories, etc.
+    row_version = models.PositiveIntegerField(_('Product|row version'),
+                                              default=0, editable=False)
+
+    updated_dt = models.DateTimeField(_('Product|updated datetime'),
+                                      auto_now=True, db_index=True)
+    # id of the latest ProductChange of the product
+    sequence = models.BigIntegerField(_('Product|sequence'), default=0,
+                                      editable=False, db_index=True)
 
     def __str__(self):
         return ('#%s ' % self.pk) + self.brand.name \
                + (' ' + self.name if self.name else '')
 
 
+class ProductChange(models.Model):
+    """
+    The latest change of a product, ordered by "id" in the order of
+    recording, which may differ a little from the order of commit.
+
+    Each product has at most one change, so the changes of deleted products
+    are the tombstones of them.
+    """
+
+    class Meta:
+        verbose_name = _('product change')
+        verbose_name_plural = _('product changes')
+
+    id = models.BigAutoField(primary_key=True)
+    # not a foreign key, the change must outlive the product
+    product_id = models.PositiveIntegerField(_('ProductChange|product ID'),
+                                             unique=True)
+
+    KIND_CREATED = 'created'
+    KIND_UPDATED = 'updated'
+    KIND_SOLD = 'sold'
+    KIND_DELETED = 'deleted'
+
+    # ordered by precedence when merging changes in one transaction
+    KINDS = (
+        (KIND_UPDATED, _('ProductChangeKind|updated')),
+        (KIND_SOLD, _('ProductChangeKind|sold')),
+        (KIND_CREATED, _('ProductChangeKind|created')),
+        (KIND_DELETED, _('ProductChangeKind|deleted')),
+    )
+
+    kind = models.CharField(_('ProductChange|kind'),
+                            max_length=20, choices=KINDS)
+    changed_dt = models.DateTimeField(_('ProductChange|changed datetime'),
+                                      auto_now=True)
+
+    def __str__(self):
+        return '#%s %s' % (self.product_id, self.kind)
+
+
+_pending_changes = threading.local()
+_KIND_PRECEDENCE = {kind: i for i, (kind, _name)
+                    in enumerate(ProductChange.KINDS)}
+
+
+def record_product_changes(product_ids, kind):
+    """
+    Record changes of products when the current transaction commits,
+    changes of a product in one transaction are merged into one.
+    """
+    pending = getattr(_pending_changes, 'changes', None)
+    if pending is None or not transaction.get_connection().in_atomic_block:
+        # anything left here belongs to a rolled back transaction
+        pending = _pending_changes.changes = {}
+    for pk in product_ids:
+        if _KIND_PRECEDENCE[kind] > _KIND_PRECEDENCE.get(pending.get(pk), -1):
+            pending[pk] = kind
+    if pending:
+        # flushing more than once is harmless
+        transaction.on_commit(_flush_product_changes)
+
+
+def _flush_product_changes(chunk_size=500):
+    changes = getattr(_pending_changes, 'changes', None)
+    _pending_changes.changes = {}
+    if not changes:
+        return
+
+    pks = sorted(changes)
+    for i in range(0, len(pks), chunk_size):
+        chunk = pks[i:i + chunk_size]
+        existing = set(Product.objects.filter(
+            pk__in=chunk).values_list('pk', flat=True))
+        # changes of a rolled back savepoint may be left here
+        chunk = [pk for pk in chunk if (pk in existing)
+                 != (changes[pk] == ProductChange.KIND_DELETED)]
+        with transaction.atomic():
+            ProductChange.objects.filter(product_id__in=chunk).delete()
+            ProductChange.objects.bulk_create([
+                ProductChange(product_id=pk, kind=changes[pk]) for pk in chunk
+            ])
+            Product.objects.filter(pk__in=chunk).update(sequence=Subquery(
+                ProductChange.objects.filter(
+                    product_id=OuterRef('pk')).values('id')[:1]))
+
+
+def _for_sale(product: Product):
+    return 0 if product.sold else 1
+
+
+def _add_to_counters(model, pks, count, for_sale_count):
+    """Add to "product_count" and "for_sale_count" of brands or categories."""
+    if pks and (count or for_sale_count):
+        model.objects.filter(pk__in=pks).update(
+            product_count=F('product_count') + count,
+            for_sale_count=F('for_sale_count') + for_sale_count)
+
+
+def _update_counters_on_product_change(old: Product, new: Product):
+    if old.brand_id != new.brand_id or old.sold != new.sold:
+        _add_to_counters(Brand, [old.brand_id], -1, -_for_sale(old))
+        _add_to_counters(Brand, [new.brand_id], 1, _for_sale(new))
+    if old.sold != new.sold:
+        _add_to_counters(
+            Category,
+            list(Product.categories.through.objects.filter(
+                product_id=new.pk).values_list('category_id', flat=True)),
+            0, _for_sale(new) - _for_sale(old))
+
+
+def recount_product_counters():
+    """Recount product counters of all brands and categories from scratch."""
+    for model in (Brand, Category):
+        for obj in model.objects.annotate(
+                counted=models.Count('products'),
+                counted_for_sale=models.Sum(models.Case(
+                    models.When(products__sold=False, then=1),
+                    default=0,
+                    output_field=models.IntegerField()
+                ))):
+            counted_for_sale = obj.counted_for_sale or 0
+            if obj.product_count != obj.counted \
+                    or obj.for_sale_count != counted_for_sale:
+                model.objects.filter(pk=obj.pk).update(
+                    product_count=obj.counted,
+                    for_sale_count=counted_for_sale)
+
+
+# fields the similarity of products depends on, besides categories,
+# see "recommendation.py"
+_NEIGHBOUR_FEATURE_FIELDS = ('brand_id', 'condition', 'price', 'sold')
+
+
 @receiver(signals.pre_save, sender=Product)
 def product_pre_save(sender, instance: Product, **kwargs):
     old = get_or_none(sender, pk=instance.pk)
     if old is None or old.sold != instance.sold:
         instance.sold_changed(old, instance)
+    # from the stored row, which "_touch_products" may have increased
+    # since this instance was loaded
+    instance.row_version = (old.row_version if old is not None
+                            else instance.row_version) + 1
+    if old is None or old.main_image.name != instance.main_image.name:
+        instance._main_image_changed = True
+        instance.main_image_hash = compute_image_hash(instance.main_image.name)
+        if old is None or old.main_image_hash != instance.main_image_hash:
+            # cleared by the post_save handler, like "_suggest_changed"
+            instance._image_hash_changed = True
+        # until the variants of the new image are generated
+        instance.main_image_variant_widths = []
+    else:
+        # recorded in the background, maybe since this instance was loaded
+        instance.main_image_variant_widths = old.main_image_variant_widths
+    if old is not None:
+        _update_counters_on_product_change(old, instance)
+        instance._change_kind = ProductChange.KIND_SOLD \
+            if instance.sold and not old.sold else ProductChange.KIND_UPDATED
+    else:
+        instance._change_kind = ProductChange.KIND_CREATED
+    if old is None or \
+            (old.name, old.style) != (instance.name, instance.style):
+        # only cleared by the post_save handler, so that a nested save
+        # in another post_save handler doesn't lose it
+        instance._suggest_changed = True
+    if old is None or any(getattr(old, f) != getattr(instance, f)
+                          for f in _NEIGHBOUR_FEATURE_FIELDS):
+        # cleared by the post_save handler, like "_suggest_changed"
+        instance._neighbour_features_changed = True
+
+
+@receiver(signals.post_save, sender=Product)
+def product_post_save_record_change(instance: Product, created, **kwargs):
+    # "_change_kind" may be overwritten by a nested save of a new product
+    record_product_changes([instance.pk], ProductChange.KIND_CREATED
+                           if created else instance._change_kind)
+
 
+@receiver(signals.post_delete, sender=Product)
+def product_post_delete_record_change(instance: Product, **kwargs):
+    record_product_changes([instance.pk], ProductChange.KIND_DELETED)
 
-def _move_image_if_needed(product_id, name):
-    if name.startswith('uploads/') and storage.exists(name):
-        pure_name = name.split('/')[-1]
-        new_dir = 'products/%s/' % product_id
-        os.makedirs(storage.path(new_dir), exist_ok=True)
-        new_name = new_dir + pure_name
-        os.rename(storage.path(name), storage.path(new_name))
-        return new_name
+
+def compute_image_hash(name):
+    """Compute the hash of a product image, empty for placeholders."""
+    if not name or name == _prod_image_placeholder_path:
+        return ''
+    return dhash(name) or ''
+
+
+@receiver(signals.pre_save, sender=ProductImage)
+def product_image_pre_save(instance: ProductImage, **kwargs):
+    old = get_or_none(ProductImage, pk=instance.pk)
+    if old is None or old.image.name != instance.image.name:
+        instance._image_changed = True
+        instance.image_hash = compute_image_hash(instance.image.name)
+        if old is None or old.image_hash != instance.image_hash:
+            instance._image_hash_changed = True
+        instance.variant_widths = []
+    else:
+        instance.variant_widths = old.variant_widths
 
 
 @receiver(signals.post_save, sender=Product)
 def product_post_save(instance: Product, **kwargs):
-    new_main_image_name = _move_image_if_needed(instance.pk,
-                                                instance.main_image.name)
-    if new_main_image_name:
-        instance.main_image = new_main_image_name
-        instance.save()
+    if instance.__dict__.pop('_main_image_changed', False):
+        schedule_thumbnails([instance.main_image.name])
+        schedule_variants([instance.main_image.name])
+
+
+@receiver(signals.post_save, sender=Product)
+def product_post_save_update_counters(instance: Product, created, **kwargs):
+    if created:
+        _add_to_counters(Brand, [instance.brand_id], 1, _for_sale(instance))
+
+
+@receiver(signals.pre_delete, sender=Product)
+def product_pre_delete_update_counters(instance: Product, **kwargs):
+    # category relations will be gone with the product
+    _add_to_counters(
+        Category, list(instance.categories.values_list('pk', flat=True)),
+        -1, -_for_sale(instance))
+
+
+@receiver(signals.post_delete, sender=Product)
+def product_post_delete_update_counters(instance: Product, **kwargs):
+    _add_to_counters(Brand, [instance.brand_id], -1, -_for_sale(instance))
 
 
 @receiver(signals.post_save, sender=ProductImage)
 def product_image_post_save(instance: ProductImage, **kwargs):
-    new_image_name = _move_image_if_needed(instance.product.pk,
-                                           instance.image.name)
-    if new_image_name:
-        instance.image = new_image_name
-        instance.save()
+    if instance.__dict__.pop('_image_changed', False):
+        schedule_thumbnails([instance.image.name])
+        schedule_variants([instance.image.name])
 
 
 @receiver(signals.m2m_changed, sender=Product.categories.through)
-def product_categories_changed(instance, action, **kwargs):
-    if action not in ('post_add', 'post_remove'):
+def product_categories_changed(instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove') or reverse:
         return
 
     # include all possible super categories
-    categories_set = set(instance.categories.all())
-    old_set = categories_set.copy()
-    for cat in instance.categories.all():
-        while cat.super_category:
-            categories_set.add(cat.super_category)
-            cat = cat.super_category
-    if categories_set != old_set:
-        instance.categories = categories_set
+    current_ids = set()
+    ancestor_ids = set()
+    for path in instance.categories.values_list('path', flat=True):
+        ids = Category.split_path(path)
+        current_ids.update(ids[-1:])
+        ancestor_ids.update(ids[:-1])
+    missing_ids = ancestor_ids - current_ids
+    if missing_ids:
+        # bulk insert won't send "m2m_changed" again
+        through = Product.categories.through
+        through.objects.bulk_create([
+            through(product_id=instance.pk, category_id=pk)
+            for pk in missing_ids
+        ])
+        _add_to_counters(Category, missing_ids, 1, _for_sale(instance))
+
+
+@receiver(signals.m2m_changed, sender=Product.categories.through)
+def product_categories_changed_update_counters(instance, action, reverse,
+                                               pk_set, **kwargs):
+    sign = {'post_add': 1, 'post_remove': -1, 'pre_clear': -1}.get(action)
+    if sign is None:
+        return
+
+    if not reverse:
+        if action == 'pre_clear':
+            pk_set = list(instance.categories.values_list('pk', flat=True))
+        _add_to_counters(Category, pk_set, sign, sign * _for_sale(instance))
+    else:
+        # "instance" is a category
+        if action == 'pre_clear':
+            products = instance.products.all()
+        else:
+            products = Product.objects.filter(pk__in=pk_set or ())
+        _add_to_counters(Category, [instance.pk],
+                         sign * products.count(),
+                         sign * products.filter(sold=False).count())
+
+
+@receiver(signals.post_save, sender=Brand)
+@receiver(signals.post_delete, sender=Brand)
+@receiver(signals.post_save, sender=Attachment)
+@receiver(signals.post_delete, sender=Attachment)
+@receiver(signals.post_save, sender=AuthenticationMethod)
+@receiver(signals.post_delete, sender=AuthenticationMethod)
+@receiver(signals.post_save, sender=ProductLocation)
+@receiver(signals.post_delete, sender=ProductLocation)
+@receiver(signals.post_save, sender=Category)
+@receiver(signals.post_delete, sender=Category)
+@receiver(signals.post_save, sender=ProductImage)
+@receiver(signals.post_delete, sender=ProductImage)
+@receiver(signals.post_save, sender=Product)
+@receiver(signals.post_delete, sender=Product)
+def catalog_changed(**kwargs):
+    # anything cached on the "catalog" version becomes stale
+    bump_version_on_commit('catalog')
+    _rebuild_catalog_snapshot_later()
+
+
+@receiver(signals.m2m_changed, sender=Product.categories.through)
+@receiver(signals.m2m_changed, sender=Product.attachments.through)
+@receiver(signals.m2m_changed, sender=Product.authentication_methods.through)
+def catalog_relation_changed(action, **kwargs):
+    if action.startswith('post_'):
+        bump_version_on_commit('catalog')
+        _rebuild_catalog_snapshot_later()
+
+
+def _rebuild_catalog_snapshot_later():
+    from ..catalog_snapshot import schedule_rebuild
+    transaction.on_commit(schedule_rebuild)
+
+
+def _touch_products(products):
+    pks = list(products.values_list('pk', flat=True))
+    if pks:
+        Product.objects.filter(pk__in=pks).update(
+            row_version=F('row_version') + 1, updated_dt=timezone.now())
+        record_product_changes(pks, ProductChange.KIND_UPDATED)
+
+
+def record_image_variants(image_path, widths):
+    """
+    Record the widths of the variants of an image once they are generated,
+    in the products and product images using the image.
+    """
+    widths = list(widths)
+    with transaction.atomic():
+        product_ids = [pk for pk, old in Product.objects.filter(
+            main_image=image_path).values_list(
+            'pk', 'main_image_variant_widths') if old != widths]
+        Product.objects.filter(pk__in=product_ids).update(
+            main_image_variant_widths=widths)
+        image_ids = []
+        for pk, product_id, old in ProductImage.objects.filter(
+                image=image_path).values_list(
+                'pk', 'product_id', 'variant_widths'):
+            if old != widths:
+                image_ids.append(pk)
+                product_ids.append(product_id)
+        ProductImage.objects.filter(pk__in=image_ids).update(
+            variant_widths=widths)
+        if product_ids:
+            # updates send no signals, so do what "catalog_changed" does
+            _touch_products(Product.objects.filter(pk__in=product_ids))
+            bump_version_on_commit('catalog')
+            _rebuild_catalog_snapshot_later()
+
+
+@receiver(signals.post_save, sender=ProductImage)
+@receiver(signals.post_delete, sender=ProductImage)
+def product_image_changed_touch_product(instance: ProductImage, **kwargs):
+    _touch_products(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(signals.post_save, sender=Brand)
+@receiver(signals.post_save, sender=ProductLocation)
+@receiver(signals.post_save, sender=AuthenticationMethod)
+def product_relation_saved_touch_products(instance, **kwargs):
+    _touch_products(instance.products.all())
+
+
+@receiver(signals.post_save, sender=Attachment)
+def attachment_saved_touch_products(instance: Attachment, **kwargs):
+    _touch_products(instance.product_set.all())
+
+
+@receiver(signals.post_save, sender=Category)
+def category_saved_touch_products(instance: Category, created, **kwargs):
+    if created:
+        return
+    # full names of descendants contain the name of this category
+    _touch_products(Product.objects.filter(
+        categories__path__startswith=instance.path))
+
+
+# deleting these cascades to the rows relating them to products without
+# sending "m2m_changed", so touch the products before they are unknown
+@receiver(signals.pre_delete, sender=AuthenticationMethod)
+def authentication_method_pre_delete_touch_products(
+        instance: AuthenticationMethod, **kwargs):
+    _touch_products(instance.products.all())
+
+
+@receiver(signals.pre_delete, sender=Attachment)
+def attachment_pre_delete_touch_products(instance: Attachment, **kwargs):
+    _touch_products(instance.product_set.all())
+
+
+@receiver(signals.pre_delete, sender=Category)
+def category_pre_delete_touch_products(instance: Category, **kwargs):
+    # descendants are deleted with this category
+    _touch_products(Product.objects.filter(
+        categories__path__startswith=instance.path))
+
+
+@receiver(signals.m2m_changed, sender=Product.categories.through)
+@receiver(signals.m2m_changed, sender=Product.attachments.through)
+@receiver(signals.m2m_changed, sender=Product.authentication_methods.through)
+def product_relation_changed_touch_products(sender, instance, action, reverse,
+                                            pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            _touch_products(Product.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        # products are unknown after clearing, so touch them before it
+        field = next(f for f in Product._meta.many_to_many
+                     if f.remote_field.through is sender)
+        _touch_products(Product.objects.filter(**{field.name: instance}))
+    elif action.startswith('post_') and pk_set:
+        _touch_products(Product.objects.filter(pk__in=pk_set))
+
+
+@receiver(signals.post_save, sender=Brand)
+@receiver(signals.post_delete, sender=Brand)
+def brand_changed_update_suggest(signal, instance: Brand, **kwargs):
+    from .. import suggest
+    terms = suggest.brand_terms(instance.pk, instance.name) \
+        if signal is signals.post_save else set()
+    suggest.object_changed(suggest.KIND_BRAND, instance.pk, terms)
+
+
+@receiver(signals.post_save, sender=Category)
+@receiver(signals.post_delete, sender=Category)
+def category_changed_update_suggest(signal, instance: Category, **kwargs):
+    from .. import suggest
+    terms = suggest.category_terms(instance.pk, instance.name) \
+        if signal is signals.post_save else set()
+    suggest.object_changed(suggest.KIND_CATEGORY, instance.pk, terms)
+
+
+@receiver(signals.post_save, sender=Product)
+def product_saved_update_suggest(instance: Product, **kwargs):
+    if instance.__dict__.pop('_suggest_changed', False):
+        from .. import suggest
+        suggest.object_changed(
+            suggest.KIND_PRODUCT, instance.pk,
+            suggest.product_terms(instance.name, instance.style))
+
+
+@receiver(signals.post_delete, sender=Product)
+def product_deleted_update_suggest(instance: Product, **kwargs):
+    from .. import suggest
+    suggest.object_changed(suggest.KIND_PRODUCT, instance.pk, set())
+
+
+@receiver(signals.post_save, sender=Product)
+def product_saved_update_image_hash_index(instance: Product, **kwargs):
+    if instance.__dict__.pop('_image_hash_changed', False):
+        from .. import image_similarity
+        image_similarity.image_changed(
+            image_similarity.SOURCE_MAIN, instance.pk,
+            instance.main_image_hash, instance.pk)
+
+
+@receiver(signals.post_delete, sender=Product)
+def product_deleted_update_image_hash_index(instance: Product, **kwargs):
+    from .. import image_similarity
+    image_similarity.image_changed(
+        image_similarity.SOURCE_MAIN, instance.pk, '', instance.pk)
+
+
+@receiver(signals.post_save, sender=ProductImage)
+def product_image_saved_update_image_hash_index(instance: ProductImage,
+                                                **kwargs):
+    if instance.__dict__.pop('_image_hash_changed', False):
+        from .. import image_similarity
+        image_similarity.image_changed(
+            image_similarity.SOURCE_EXTRA, instance.pk,
+            instance.image_hash, instance.product_id)
+
+
+@receiver(signals.post_delete, sender=ProductImage)
+def product_image_deleted_update_image_hash_index(instance: ProductImage,
+                                                  **kwargs):
+    from .. import image_similarity
+    image_similarity.image_changed(
+        image_similarity.SOURCE_EXTRA, instance.pk, '', instance.product_id)
@@ -0,0 +1,76 @@
+import threading
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import signals
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+
+from .product import Product
+from ..thread_pool import delay_run
+
+__all__ = ['ProductNeighbour']
+
+
+class ProductNeighbour(models.Model):
+    """Precomputed similar product, see "recommendation.py"."""
+
+    class Meta:
+        verbose_name = _('product neighbour')
+        verbose_name_plural = _('product neighbours')
+        unique_together = ('product', 'neighbour')
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                related_name='neighbours',
+                                verbose_name=_('product'))
+    neighbour = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                  related_name='+',
+                                  verbose_name=_('neighbour'))
+    score = models.FloatField(_('similarity score'))
+
+    def __str__(self):
+        return '%s -> %s' % (self.product_id, self.neighbour_id)
+
+
+_pending_products = set()
+_pending_lock = threading.Lock()
+
+
+def _update_pending_neighbours():
+    from ..recommendation import update_product_neighbours
+    with _pending_lock:
+        product_ids = set(_pending_products)
+        _pending_products.clear()
+    if product_ids:
+        update_product_neighbours(product_ids)
+
+
+def _update_neighbours_later(product_id):
+    """
+    Update neighbours of the product a little later, after the current
+    transaction commits, in a batch with other products changed meanwhile.
+    """
+
+    def schedule():
+        with _pending_lock:
+            scheduled = bool(_pending_products)
+            _pending_products.add(product_id)
+        if not scheduled:
+            delay_run(settings.RECOMMENDATION_UPDATE_DELAY,
+                      _update_pending_neighbours)
+
+    transaction.on_commit(schedule)
+
+
+@receiver(signals.post_save, sender=Product)
+def product_post_save_update_neighbours(instance: Product, **kwargs):
+    # created, or changed in brand, condition, price or sold
+    if instance.__dict__.pop('_neighbour_features_changed', False):
+        _update_neighbours_later(instance.pk)
+
+
+@receiver(signals.m2m_changed, sender=Product.categories.through)
+def product_categories_changed_update_neighbours(instance, action, reverse,
+                                                 **kwargs):
+    if action in ('post_add', 'post_remove') and not reverse:
+        _update_neighbours_later(instance.pk)
@@ -0,0 +1,97 @@
+from django.db import models, transaction
+from django.db.models import signals
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+
+from .product import Brand, Category, Product
+
+__all__ = ['ProductSearchDocument', 'update_search_documents']
+
+
+class ProductSearchDocument(models.Model):
+    """Denormalized searchable text of a product
+
+    The full-text index is built on this table (see "search.py"),
+    so that searching never has to join brands and categories.
+    """
+
+    class Meta:
+        verbose_name = _('product search document')
+        verbose_name_plural = _('product search documents')
+
+    product = models.OneToOneField(Product, primary_key=True,
+                                   on_delete=models.CASCADE,
+                                   related_name='search_document',
+                                   verbose_name=_('product'))
+    text = models.TextField(_('text'), blank=True)
+
+    @staticmethod
+    def make_text(product: Product):
+        parts = [product.brand.name, product.name, product.style,
+                 product.size]
+        parts += [cat.name for cat in product.categories.all()]
+        parts.append(product.description)
+        return '\n'.join(filter(None, parts))
+
+    def __str__(self):
+        return str(self.product_id)
+
+
+def update_search_documents(products, chunk_size=500):
+    """(Re)build search documents of the given product queryset."""
+    pks = list(products.values_list('pk', flat=True))
+    for i in range(0, len(pks), chunk_size):
+        chunk = Product.objects.filter(
+            pk__in=pks[i:i + chunk_size]
+        ).select_related('brand').prefetch_related('categories')
+        docs = [ProductSearchDocument(product_id=prod.pk,
+                                      text=ProductSearchDocument.make_text(
+                                          prod))
+                for prod in chunk]
+        with transaction.atomic():
+            ProductSearchDocument.objects.filter(
+                product_id__in=[doc.product_id for doc in docs]).delete()
+            ProductSearchDocument.objects.bulk_create(docs)
+
+
+@receiver(signals.post_save, sender=Product)
+def product_post_save_update_search_document(instance: Product, **kwargs):
+    update_search_documents(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(signals.m2m_changed, sender=Product.categories.through)
+def product_categories_changed_update_search_document(instance, action,
+                                                      reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # "instance" is a category
+        update_search_documents(instance.products.all())
+    else:
+        update_search_documents(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(signals.post_save, sender=Brand)
+def brand_post_save_update_search_documents(instance: Brand, created,
+                                            **kwargs):
+    if not created:
+        update_search_documents(instance.products.all())
+
+
+@receiver(signals.post_save, sender=Category)
+def category_post_save_update_search_documents(instance: Category, created,
+                                               **kwargs):
+    if not created:
+        update_search_documents(instance.products.all())
+
+
+@receiver(signals.pre_delete, sender=Brand)
+@receiver(signals.pre_delete, sender=Category)
+def brand_or_category_pre_delete_update_search_documents(instance,
+                                                         **kwargs):
+    # products are unknown after the relations are deleted,
+    # and their names are still in the documents until then
+    pks = list(instance.products.values_list('pk', flat=True))
+    if pks:
+        transaction.on_commit(lambda: update_search_documents(
+            Product.objects.filter(pk__in=pks)))
@@ -1,6 +1,4 @@
 import functools
-import os
-import hashlib
 
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
@@ -12,7 +10,8 @@ from jsonfield import JSONField
 
 from .address import AbstractAddress
 from .helpers import *
-from ..file_storage import storage
+from ..file_storage import blob_storage
+from ..image_utils import schedule_thumbnails
 from .. import mail_shortcuts as mail
 
 __all__ = ['SellRequestSenderAddress', 'SellRequest',
@@ -32,20 +31,19 @@ class SellRequestSenderAddress(AbstractAddress):
 
 
 def _shipping_label_upload_path(instance, filename):
-    filename, ext = os.path.splitext(filename)
-    now = timezone.now()
-    filename_hash = hashlib.md5()
-    filename_hash.update(filename.encode('utf-8'))
-    filename_hash.update(str(now.timestamp()).encode('utf-8'))
-    return 'sell_requests/%s/shipping-label-%s%s' % (
-        instance.pk, filename_hash.hexdigest(), ext
-    )
+    # "blob_storage" names the file by its content, keeping the extension
+    return filename
 
 
 class SellRequest(models.Model):
     class Meta:
         verbose_name = _('sell request')
         verbose_name_plural = _('sell requests')
+        indexes = [
+            # "closeundecidedsellrequests" command
+            models.Index(fields=['status', 'valuated_dt'],
+                         name='shop_sellreq_status_val_idx'),
+        ]
 
     created_dt = models.DateTimeField(_('created datetime'), auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
@@ -123,6 +121,7 @@ class SellRequest(models.Model):
 
     shipping_label = models.FileField(_('shipping label'),
                                       upload_to=_shipping_label_upload_path,
+                                      storage=blob_storage,
                                       null=True, blank=True)
     express_company = models.CharField(_('express company'),
                                        null=True, blank=True, max_length=60)
@@ -168,17 +167,7 @@ def sell_request_post_save(instance, created, **kwargs):
     if created:
         # notify related user and staffs
         mail.notify_sell_request_created(instance)
-
-        # move uploaded files
-        for index, name in enumerate(instance.image_paths):
-            if name.startswith('uploads/') and storage.exists(name):
-                pure_name = name.split('/')[-1]
-                new_dir = 'sell_requests/%s/' % instance.pk
-                os.makedirs(storage.path(new_dir), exist_ok=True)
-                new_name = new_dir + pure_name
-                instance.image_paths[index] = new_name
-                os.rename(storage.path(name), storage.path(new_name))
-        instance.save()
+        schedule_thumbnails(instance.image_paths)
 
 
 # all sides of the status transition graph
@@ -0,0 +1,202 @@
+"""
+Item-to-item product similarity
+
+Every product is described by its brand, detail level categories,
+condition, price band and price. The similarity of two products is
+the weighted sum of their matched features, plus a small term for close
+prices, which breaks ties. The top neighbours of every product,
+among unsold products, are stored as "ProductNeighbour" rows,
+so that the recommendation endpoint only needs one query to read them.
+
+"buildrecommendations" rebuilds all of them, daily by cron, between
+rebuilds products created or changed in features are updated in batches
+by "update_product_neighbours", which also puts them into the neighbours
+of other products, or takes sold ones out.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+
+from .models.product import Product
+from .models.recommendation import ProductNeighbour
+
+WEIGHT_BRAND = 3.0
+WEIGHT_CATEGORY = 4.0
+WEIGHT_CONDITION = 1.0
+WEIGHT_PRICE_BAND = 1.5
+WEIGHT_PRICE = 0.5
+
+_CHUNK_SIZE = 256
+
+
+class _Features(object):
+    """Feature matrix of all products"""
+
+    def __init__(self):
+        rows = list(Product.objects.order_by('pk').values_list(
+            'pk', 'brand_id', 'condition', 'price', 'sold'))
+        conditions = {c: i for i, (c, _) in enumerate(Product.CONDITIONS)}
+
+        self.pks = np.array([r[0] for r in rows], dtype=np.int64)
+        self.brands = np.array([r[1] for r in rows], dtype=np.int64)
+        self.conditions = np.array([conditions.get(r[2], -1) for r in rows],
+                                   dtype=np.int64)
+        prices = np.array([max(r[3], 0.0) for r in rows], dtype=np.float64)
+        self.price_bands = np.searchsorted(
+            np.array(settings.PRICE_BANDS, dtype=np.float64),
+            prices, side='right')
+        self.log_prices = np.log1p(prices)
+        self.index = {pk: i for i, pk in enumerate(self.pks.tolist())}
+
+        # multi-hot matrix of detail level categories
+        links = list(Product.categories.through.objects.filter(
+            category__level=settings.DETAIL_CATEGORY_LEVEL
+        ).values_list('product_id', 'category_id'))
+        category_codes = {}
+        for _, cat_id in links:
+            category_codes.setdefault(cat_id, len(category_codes))
+        self.categories = np.zeros((len(rows), max(len(category_codes), 1)),
+                                   dtype=np.float32)
+        for prod_id, cat_id in links:
+            if prod_id in self.index:
+                self.categories[self.index[prod_id],
+                                category_codes[cat_id]] = 1.0
+
+        # only unsold products can be recommended
+        self.candidates = np.flatnonzero(
+            ~np.array([r[4] for r in rows], dtype=bool))
+
+    def similarity(self, rows, cand=None):
+        """Similarity matrix between "rows" and candidates (default all)."""
+        cand = self.candidates if cand is None else cand
+        scores = WEIGHT_BRAND * (
+            self.brands[rows, None] == self.brands[None, cand])
+        scores = scores + WEIGHT_CATEGORY * np.dot(
+            self.categories[rows], self.categories[cand].T)
+        scores += WEIGHT_CONDITION * (
+            self.conditions[rows, None] == self.conditions[None, cand])
+        scores += WEIGHT_PRICE_BAND * (
+            self.price_bands[rows, None] == self.price_bands[None, cand])
+        scores += WEIGHT_PRICE / (1.0 + np.abs(
+            self.log_prices[rows, None] - self.log_prices[None, cand]))
+        # a product is not a neighbour of itself
+        scores[rows[:, None] == cand[None, :]] = -np.inf
+        return scores
+
+    def neighbours(self, rows, k):
+        """Yield (product pk, [(neighbour pk, score), ...]) of "rows"."""
+        k = min(k, len(self.candidates))
+        if k <= 0:
+            return
+        for start in range(0, len(rows), _CHUNK_SIZE):
+            chunk = rows[start:start + _CHUNK_SIZE]
+            scores = self.similarity(chunk)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for i, row in enumerate(chunk):
+                pairs = sorted(((self.pks[self.candidates[j]], scores[i, j])
+                                for j in top[i] if np.isfinite(scores[i, j])),
+                               key=lambda p: -p[1])
+                yield self.pks[row], pairs
+
+
+def _make_rows(product_pk, pairs):
+    return [ProductNeighbour(product_id=int(product_pk),
+                             neighbour_id=int(pk), score=float(score))
+            for pk, score in pairs]
+
+
+def rebuild_neighbours(k=None, batch_size=1000):
+    """Recompute neighbours of all products."""
+    k = k or settings.RECOMMENDATION_NEIGHBOURS
+    features = _Features()
+    count = 0
+    batch = []
+    with transaction.atomic():
+        ProductNeighbour.objects.all().delete()
+        for product_pk, pairs in features.neighbours(
+                np.arange(len(features.pks)), k):
+            batch += _make_rows(product_pk, pairs)
+            if len(batch) >= batch_size:
+                ProductNeighbour.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        ProductNeighbour.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def _add_as_neighbour(features, rows, k):
+    """
+    Put the candidates among "rows" into the neighbours of other products,
+    where they score higher than the current k-th neighbour.
+    """
+    cand = np.intersect1d(rows, features.candidates)
+    if not len(cand):
+        return
+    current = {
+        product_id: (min_score, count)
+        for product_id, min_score, count in ProductNeighbour.objects.values(
+            'product_id').annotate(min_score=models.Min('score'),
+                                   count=models.Count('id')).values_list(
+            'product_id', 'min_score', 'count')
+    }
+    others = np.setdiff1d(np.arange(len(features.pks)), rows)
+    for start in range(0, len(others), _CHUNK_SIZE):
+        chunk = others[start:start + _CHUNK_SIZE]
+        scores = features.similarity(chunk, cand)
+        new_pairs = {}
+        for i, row in enumerate(chunk):
+            product_pk = int(features.pks[row])
+            min_score, count = current.get(product_pk, (None, 0))
+            pairs = [(features.pks[cand[j]], scores[i, j])
+                     for j in range(len(cand))
+                     if np.isfinite(scores[i, j]) and (
+                         count < k or scores[i, j] > min_score)]
+            if pairs:
+                new_pairs[product_pk] = pairs
+        if not new_pairs:
+            continue
+
+        # one query for each of reading, deleting and writing the chunk
+        old_pairs = {}
+        for product_pk, neighbour_pk, score in \
+                ProductNeighbour.objects.filter(
+                    product_id__in=list(new_pairs)).values_list(
+                    'product_id', 'neighbour_id', 'score'):
+            old_pairs.setdefault(product_pk, []).append((neighbour_pk, score))
+        ProductNeighbour.objects.filter(
+            product_id__in=list(new_pairs)).delete()
+        ProductNeighbour.objects.bulk_create([
+            row for product_pk, pairs in new_pairs.items()
+            for row in _make_rows(product_pk, sorted(
+                old_pairs.get(product_pk, []) + pairs,
+                key=lambda p: -p[1])[:k])
+        ])
+
+
+def update_product_neighbours(product_pks, k=None):
+    """
+    Recompute neighbours of changed products, e.g. newly added ones,
+    and put them into the neighbours of other products
+    where they fit now, loading the features once for all of them.
+    """
+    k = k or settings.RECOMMENDATION_NEIGHBOURS
+    features = _Features()
+    rows = np.array(sorted(features.index[pk] for pk in product_pks
+                           if pk in features.index), dtype=np.int64)
+    if not len(rows):
+        return
+    changed = [int(pk) for pk in features.pks[rows]]
+    with transaction.atomic():
+        ProductNeighbour.objects.filter(product_id__in=changed).delete()
+        ProductNeighbour.objects.bulk_create([
+            row for pk, pairs in features.neighbours(rows, k)
+            for row in _make_rows(pk, pairs)
+        ])
+        # scores as neighbours of others have changed, products losing
+        # them get them back below if they still fit, or have fewer
+        # neighbours until the next rebuild
+        ProductNeighbour.objects.filter(neighbour_id__in=changed).exclude(
+            product_id__in=changed).delete()
+        _add_as_neighbour(features, rows, k)
@@ -1,11 +1,39 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.validators import EMPTY_VALUES
+from django.db.models.constants import LOOKUP_SEP
 from django_filters import rest_framework as filters
 
 
+def _is_multi_valued(model, field_path):
+    """Check if a field path crosses a to-many relation."""
+    for name in field_path.split(LOOKUP_SEP):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if field.many_to_many or field.one_to_many:
+            return True
+        if not field.is_relation:
+            return False
+        model = field.related_model
+    return False
+
+
 class CommaSplitListFilter(filters.Filter):
-    def __init__(self, *args, **kwargs):
-        super().__init__(distinct=True, *args, **kwargs)
+    """Filter by a comma separated list of values
+
+    Local columns are filtered with a plain IN. Multi-valued relations
+    are filtered with "pk IN (subquery)" instead of a join,
+    so the queryset never needs DISTINCT.
+    """
 
     def filter(self, qs, value):
-        value_list = value.split(',')
-        self.lookup_expr = 'in'
-        return super().filter(qs, value_list)
+        if value in EMPTY_VALUES:
+            return qs
+
+        lookup = {'%s__in' % self.name: value.split(',')}
+        if not _is_multi_valued(qs.model, self.name):
+            return self.get_method(qs)(**lookup)
+
+        subquery = qs.model._default_manager.filter(**lookup).values('pk')
+        return self.get_method(qs)(pk__in=subquery)
@@ -0,0 +1,111 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetOrPageNumberPagination(PageNumberPagination):
+    """Page number pagination, with an opt-in keyset (cursor) mode
+
+    Passing the "cursor" query param (an empty one for the first page)
+    switches to keyset mode, in which the queryset is ordered by
+    "keyset_ordering", and every page starts right after the last row of
+    the previous page, without counting rows nor using OFFSET.
+    The last field of "keyset_ordering" must be unique, e.g. "id",
+    so that rows with the same values of other fields keep a stable order.
+    Other filters still apply, but ordering params are ignored in this mode.
+    """
+
+    keyset_ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def __init__(self):
+        self.keyset_mode = False
+        self.next_cursor = None
+        self.request = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        queryset = queryset.order_by(*self.keyset_ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self._keyset_q(self._decode_cursor(queryset.model, cursor)))
+
+        # fetch one more row to know if there is a next page
+        results = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_cursor = self._encode_cursor(results[-1])
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.next_cursor)
+
+    def _field_names(self):
+        return [f.lstrip('-') for f in self.keyset_ordering]
+
+    def _keyset_q(self, values):
+        # (a, b, c) after (x, y, z) in lexicographic order:
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        result = None
+        equal = {}
+        for field, value in zip(self.keyset_ordering, values):
+            name = field.lstrip('-')
+            lookup = name + ('__lt' if field.startswith('-') else '__gt')
+            condition = Q(**equal) & Q(**{lookup: value})
+            result = condition if result is None else result | condition
+            equal[name] = value
+        return result
+
+    def _encode_cursor(self, obj):
+        values = [getattr(obj, name) for name in self._field_names()]
+        # keep full precision of datetimes,
+        # DjangoJSONEncoder would truncate microseconds
+        values = [v.isoformat() if hasattr(v, 'isoformat') else v
+                  for v in values]
+        raw = json.dumps(values)
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, model, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+            values = json.loads(raw.decode('utf-8'))
+            names = self._field_names()
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value)
+                    for name, value in zip(names, values)]
+        except Exception:
+            raise exceptions.NotFound(self.invalid_cursor_message)
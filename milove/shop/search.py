@@ -0,0 +1,98 @@
+import functools
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models.product import Product
+from .models.search import ProductSearchDocument
+
+_PRODUCT_TABLE = Product._meta.db_table
+_DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+FTS5_TABLE = _DOCUMENT_TABLE + '_fts'
+
+
+class SearchBackend(object):
+    """Fallback backend, scans the search documents, without any join
+
+    A backend filters a product queryset by a list of search terms,
+    every term must match. Ranked backends also annotate the queryset
+    with "search_rank", the larger the more relevant.
+    """
+
+    ranked = False
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(search_document__text__icontains=term)
+        return queryset
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """Backend using the FTS5 table with a trigram tokenizer
+
+    The table needs SQLite 3.34 or later, see the migration creating it.
+    """
+
+    ranked = True
+    min_term_length = 3  # trigram can't match anything shorter
+
+    def search(self, queryset, terms):
+        if any(len(term) < self.min_term_length for term in terms):
+            return super().search(queryset, terms)
+
+        query = ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT rowid FROM {fts} WHERE {fts} MATCH %s'.format(
+                fts=FTS5_TABLE), (query,)
+        )).annotate(search_rank=RawSQL(
+            # bm25() gives more relevant rows smaller values
+            'SELECT -bm25({fts}) FROM {fts} '
+            'WHERE {fts} MATCH %s AND rowid = {prod}.id'.format(
+                fts=FTS5_TABLE, prod=_PRODUCT_TABLE), (query,)
+        ))
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """Backend using the FULLTEXT index with the ngram parser"""
+
+    ranked = True
+    min_term_length = 2  # default "ngram_token_size"
+
+    def search(self, queryset, terms):
+        if any(len(term) < self.min_term_length for term in terms):
+            return super().search(queryset, terms)
+
+        query = ' '.join('+"%s"' % term.replace('"', ' ') for term in terms)
+        match = 'MATCH(text) AGAINST (%s IN BOOLEAN MODE)'
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT product_id FROM {doc} WHERE {match}'.format(
+                doc=_DOCUMENT_TABLE, match=match), (query,)
+        )).annotate(search_rank=RawSQL(
+            'SELECT {match} FROM {doc} WHERE product_id = {prod}.id'.format(
+                doc=_DOCUMENT_TABLE, match=match, prod=_PRODUCT_TABLE),
+            (query,)
+        ))
+
+
+_VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'mysql': MySQLFullTextBackend,
+}
+
+
+@functools.lru_cache()
+def _has_fts5_table():
+    return FTS5_TABLE in connection.introspection.table_names()
+
+
+def get_search_backend():
+    path = settings.PRODUCT_SEARCH_BACKEND
+    if path:
+        return import_string(path)()
+    backend = _VENDOR_BACKENDS.get(connection.vendor, SearchBackend)
+    if backend is SQLiteFTS5Backend and not _has_fts5_table():
+        # migrated with an SQLite too old to create it
+        backend = SearchBackend
+    return backend()
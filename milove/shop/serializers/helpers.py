@@ -1,4 +1,11 @@
-from rest_framework import serializers
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db import models
+from rest_framework import relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
 
 
 class PrimaryKeyRelatedFieldFilterByUser(serializers.PrimaryKeyRelatedField):
@@ -10,3 +17,187 @@ class PrimaryKeyRelatedFieldFilterByUser(serializers.PrimaryKeyRelatedField):
         return self.queryset.filter(**{
             self.user_field_name: self.context['request'].user
         })
+
+
+class SparseFieldsMixin(object):
+    """Let clients pick fields by the "fields" and "exclude" query params
+
+    Both params are comma separated field names, fields of nested
+    serializers are written as dotted paths, e.g.
+    "fields=id,status,items.product.id,items.product.price".
+    A nested serializer not mentioned in "fields" keeps all its fields.
+    """
+
+    @staticmethod
+    def get_sparse_fields(request):
+        """Get (included field paths or None, excluded field paths)."""
+        include = request.query_params.get('fields')
+        exclude = request.query_params.get('exclude')
+        include = set(filter(None, include.split(','))) if include else None
+        exclude = set(filter(None, exclude.split(','))) if exclude else set()
+        return include, exclude
+
+    @classmethod
+    def select_field_names(cls, field_names, request, path=''):
+        """Filter field names of the serializer at "path" by the request."""
+        if request is None:
+            return list(field_names)
+
+        include, exclude = cls.get_sparse_fields(request)
+        prefix = path + '.' if path else ''
+        result = [name for name in field_names
+                  if prefix + name not in exclude]
+        if include is not None:
+            wanted = {f[len(prefix):].split('.')[0]
+                      for f in include if f.startswith(prefix)}
+            if wanted or not path:
+                result = [name for name in result if name in wanted]
+        return result
+
+    def _get_sparse_path(self):
+        names = []
+        node = self
+        while node is not None:
+            if getattr(node, 'field_name', None):
+                names.append(node.field_name)
+            node = getattr(node, 'parent', None)
+        return '.'.join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = set(self.select_field_names(
+            fields.keys(), self.context.get('request'),
+            self._get_sparse_path()))
+        return OrderedDict((k, v) for k, v in fields.items() if k in names)
+
+
+# fields whose "to_representation" is just a type conversion
+_CONVERTERS = {
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.CharField: str,
+}
+
+
+def _get_model_field(model, source_attrs):
+    if model is None or len(source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(source_attrs[0])
+    except FieldDoesNotExist:
+        return None
+    return model_field if model_field.concrete else None
+
+
+def _make_getter(field, model_field):
+    """Make a function getting the attribute of the field from an object."""
+    if model_field is None:
+        return field.get_attribute
+    if not model_field.is_relation:
+        return attrgetter(model_field.name)
+
+    def get_related(instance):
+        try:
+            return getattr(instance, model_field.name)
+        except ObjectDoesNotExist:
+            return None
+
+    return get_related
+
+
+def _compile_field(field, model):
+    """
+    Compile a field into a function representing the field of an object,
+    which raises SkipField if the field should be omitted.
+    """
+    model_field = _get_model_field(model, field.source_attrs)
+    get = _make_getter(field, model_field)
+
+    if type(field) is serializers.ListSerializer:
+        represent_child = compile_serializer(field.child)
+
+        def represent_list(instance):
+            value = get(instance)
+            if value is None:
+                return None
+            if isinstance(value, models.Manager):
+                value = value.all()
+            return [represent_child(item) for item in value]
+
+        return represent_list
+
+    if isinstance(field, serializers.Serializer):
+        represent_nested = compile_serializer(field)
+
+        def represent_object(instance):
+            value = get(instance)
+            return None if value is None else represent_nested(value)
+
+        return represent_object
+
+    if type(field) is relations.ManyRelatedField:
+        child_to_representation = field.child_relation.to_representation
+
+        def represent_many(instance):
+            return [child_to_representation(item)
+                    for item in field.get_attribute(instance)]
+
+        return represent_many
+
+    if type(field) is relations.PrimaryKeyRelatedField \
+            and field.pk_field is None \
+            and model_field is not None and model_field.many_to_one:
+        # same as the "pk only optimization" of the field
+        return attrgetter(model_field.attname)
+
+    if model_field is not None \
+            and not isinstance(field, relations.RelatedField):
+        convert = _CONVERTERS.get(type(field), field.to_representation)
+
+        def represent_value(instance):
+            value = get(instance)
+            return None if value is None else convert(value)
+
+        return represent_value
+
+    def represent_any(instance):
+        attribute = field.get_attribute(instance)
+        check_for_none = attribute.pk \
+            if isinstance(attribute, PKOnlyObject) else attribute
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+
+    return represent_any
+
+
+def compile_serializer(serializer):
+    """Compile a serializer into a function representing an object
+
+    The function returns exactly what "serializer.to_representation" does,
+    while fields are looked up and dispatched only once, here, rather than
+    for every object, and common fields of model attributes take shortcuts.
+    Fields without a shortcut are represented by themselves.
+
+    Fields may depend on the context (e.g. the request of sparse fieldsets),
+    so compile a serializer bound with the same context as it'd be used.
+    """
+    if type(serializer).to_representation \
+            is not serializers.Serializer.to_representation:
+        # customized representation
+        return serializer.to_representation
+
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    steps = [(field.field_name, _compile_field(field, model))
+             for field in serializer._readable_fields]
+
+    def represent(instance):
+        ret = OrderedDict()
+        for field_name, represent_field in steps:
+            try:
+                ret[field_name] = represent_field(instance)
+            except SkipField:
+                pass
+        return ret
+
+    return represent
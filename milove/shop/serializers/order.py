@@ -2,6 +2,7 @@ from collections import OrderedDict
 
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from ..models.order import *
@@ -9,7 +10,7 @@ from ..models.product import Product
 from ..models.address import Address
 from ..models.coupon import Coupon
 from ..serializers.product import ProductSerializer
-from .helpers import PrimaryKeyRelatedFieldFilterByUser
+from .helpers import PrimaryKeyRelatedFieldFilterByUser, SparseFieldsMixin
 from .. import mail_shortcuts as mail
 from ..thread_pool import delay_run
 
@@ -23,7 +24,7 @@ class ShippingAddressSerializer(serializers.ModelSerializer):
         exclude = ('id', 'order')
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -31,7 +32,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         exclude = ('id', 'order')
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(read_only=True, many=True)
     shipping_address = ShippingAddressSerializer(read_only=True)
 
@@ -43,6 +44,22 @@ class OrderSerializer(serializers.ModelSerializer):
                             'created_dt', 'shipping_address',
                             'express_company', 'tracking_number')
 
+    @staticmethod
+    def setup_eager_loading(queryset, request=None):
+        """
+        Make the queryset fetch order items, their products,
+        and the shipping address, in a fixed number of queries.
+        Sparse fields in the request trim the products fetched.
+        """
+        product_fields = SparseFieldsMixin.select_field_names(
+            ProductSerializer().fields.keys(), request, 'items.product')
+        return queryset.select_related('shipping_address').prefetch_related(
+            'items',
+            Prefetch('items__product',
+                     queryset=ProductSerializer.setup_eager_loading(
+                         Product.objects.all(), product_fields)),
+        )
+
     def update(self, instance, validated_data):
         if instance.status in (Order.STATUS_UNPAID, Order.STATUS_PAID):
             # in "unpaid" or "paid" status, can update comment
@@ -1,9 +1,19 @@
+import functools
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import serializers
+from rest_framework.utils.field_mapping import get_nested_relation_kwargs
 
 from ..models.product import *
+from ..catalog_snapshot import get_snapshot
+from ..image_utils import get_variant_names
+from .helpers import SparseFieldsMixin, compile_serializer
 
 __all__ = ['BrandSerializer', 'CategorySerializer',
-           'AttachmentSerializer', 'ProductSerializer']
+           'AttachmentSerializer', 'ProductSerializer',
+           'represent_product', 'serialize_products']
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -19,15 +29,23 @@ class AttachmentSerializer(serializers.ModelSerializer):
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    fullname = serializers.CharField(source='__str__')
+    fullname = serializers.CharField(source='full_name')
     simple_name = serializers.CharField()
 
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ('path', 'full_name', 'product_count', 'for_sale_count')
+
+
+class _ProductBrandSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Brand
+        # counters change with other products,
+        # they don't belong to the representation of a product
+        exclude = ('product_count', 'for_sale_count')
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class ProductImageField(serializers.RelatedField):
         def to_internal_value(self, data):
             return super().to_internal_value(data)
@@ -39,8 +57,129 @@ class ProductSerializer(serializers.ModelSerializer):
     images = ProductImageField(many=True, read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
     brief_info = serializers.CharField(read_only=True)
+    variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        exclude = ('buy_back_price',)  # hide this field to users
+        # hide "buy_back_price" to users
+        exclude = ('buy_back_price', 'row_version', 'updated_dt', 'sequence',
+                   'main_image_hash', 'main_image_variant_widths')
         depth = 1
+
+    def get_variants(self, product):
+        """
+        Map "main_image" and "images" to their responsive variants,
+        as {format: {width: name}}. Only variants generated and no wider
+        than the image are included, an image without any, including
+        placeholders, is left out, for clients to use the image itself.
+        """
+        images = [(product.main_image.name,
+                   product.main_image_variant_widths)]
+        images += [(image.image.name, image.variant_widths)
+                   for image in product.images.all()]
+        return OrderedDict((name, get_variant_names(name, widths))
+                           for name, widths in images if widths)
+
+    def build_nested_field(self, field_name, relation_info, nested_depth):
+        if field_name == 'brand':
+            return _ProductBrandSerializer, get_nested_relation_kwargs(
+                relation_info)
+        return super().build_nested_field(field_name, relation_info,
+                                          nested_depth)
+
+    @staticmethod
+    def setup_eager_loading(queryset, field_names=None):
+        """
+        Make the queryset fetch all relations this serializer needs
+        in a fixed number of queries, no matter how many products there are.
+
+        If "field_names" is given, only relations and columns
+        needed by these fields are fetched.
+        """
+        if field_names is None:
+            return queryset.select_related(
+                'brand', 'location'
+            ).prefetch_related(
+                'attachments', 'authentication_methods', 'images',
+                'categories',
+            )
+
+        field_names = set(field_names)
+        concrete = {f.name for f in Product._meta.concrete_fields}
+        # always needed by the default ordering and keyset pagination
+        columns = {'id', 'sold', 'published_dt'}
+        columns.update(field_names & concrete)
+        if 'brief_info' in field_names:
+            columns.update(('style', 'color', 'size', 'condition'))
+        if 'variants' in field_names:
+            columns.update(('main_image', 'main_image_variant_widths'))
+            field_names.add('images')
+        return queryset.select_related(
+            *(field_names & {'brand', 'location'})
+        ).prefetch_related(
+            *(field_names & {'attachments', 'authentication_methods',
+                             'images', 'categories'})
+        ).only(*columns)
+
+
+@functools.lru_cache()
+def _compiled_product_serializer():
+    # fields of the serializer without context never change
+    return compile_serializer(ProductSerializer())
+
+
+def represent_product(product):
+    """Same as "ProductSerializer(product).data", but faster."""
+    return _compiled_product_serializer()(product)
+
+
+# bumped whenever the representation of products changes, so that
+# cached representations of the old format are never used
+REPRESENTATION_VERSION = 3
+
+
+def _fragment_key(product):
+    return 'product_fragment:%s:%s:%s' % (product.pk, product.row_version,
+                                          REPRESENTATION_VERSION)
+
+
+def serialize_products(products):
+    """
+    Serialize products with ProductSerializer (all fields),
+    through the catalog snapshot and a cache of each product's
+    representation.
+
+    The given products only need "id" and "row_version" loaded,
+    missed ones are fetched again with all their relations.
+    """
+    products = list(products)
+    keys = [_fragment_key(prod) for prod in products]
+    fragments = {}
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        for prod, key in zip(products, keys):
+            card = snapshot.get_card(prod.pk, prod.row_version)
+            if card is not None:
+                fragments[key] = card
+    if len(fragments) < len(keys):
+        fragments.update(cache.get_many(
+            [key for key in keys if key not in fragments]))
+
+    missed_pks = [prod.pk for prod, key in zip(products, keys)
+                  if key not in fragments]
+    if missed_pks:
+        missed = ProductSerializer.setup_eager_loading(
+            Product.objects.filter(pk__in=missed_pks))
+        new_fragments = {}
+        for prod in missed:
+            new_fragments[_fragment_key(prod)] = represent_product(prod)
+        cache.set_many(new_fragments, settings.PRODUCT_FRAGMENT_CACHE_TIMEOUT)
+        # the product may have changed since the page was queried,
+        # in that case use the newer representation
+        latest = {int(key.split(':')[1]): data
+                  for key, data in new_fragments.items()}
+        for prod, key in zip(products, keys):
+            if key not in fragments and prod.pk in latest:
+                fragments[key] = latest[prod.pk]
+
+    return [fragments[key] for key in keys if key in fragments]
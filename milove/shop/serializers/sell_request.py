@@ -5,6 +5,7 @@ from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
 from ..models.sell_request import *
+from ..file_storage import BLOB_DIR
 from ..validators import validate_json_array, validate_files_exist
 
 __all__ = ['SellRequestSenderAddressSerializer',
@@ -21,7 +22,7 @@ def validate_uploaded_files(value):
     if not isinstance(value, Iterable):
         return
     for name in value:
-        if not name.startswith('uploads/'):
+        if not name.startswith(BLOB_DIR + '/'):
             raise ValidationError(_('File %(name)s is not valid.'),
                                   params={'name': name})
 
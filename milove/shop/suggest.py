@@ -0,0 +1,194 @@
+"""
+Prefix autocomplete of brand names, category names and product names/styles
+
+Every worker process keeps its own index in memory, a sorted array of
+(key, term) pairs, where keys are the lowercased suffixes of a term starting
+at each word, so that "vuit" completes "Louis Vuitton". A lookup is a
+binary search followed by a short scan.
+
+Saves in this process update the index in place, saves elsewhere are
+noticed through the "suggest" version counter, and cause a rebuild in the
+background, while the stale index keeps serving until the new one replaces
+it. Only the first lookup of a process waits for a build.
+"""
+
+import bisect
+import threading
+
+from django.db import transaction
+
+from .cache_utils import get_version, bump_version
+from .thread_pool import async_run
+
+KIND_BRAND = 'brand'
+KIND_CATEGORY = 'category'
+KIND_PRODUCT = 'product'
+
+
+def _normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def _keys(text):
+    words = _normalize(text).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class SuggestIndex(object):
+    """
+    A term is a (kind, text, id) tuple, where id is the pk of the brand or
+    category, or None for product names and styles, which are shared by
+    many products. Objects own terms, and a term lives as long as any
+    object owns it.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._entries = []  # sorted (key, term) pairs
+        self._ref_counts = {}  # term -> number of owners
+        self._owned_terms = {}  # (kind, pk) -> set of terms
+        self._lock = threading.Lock()
+
+    def _add_term(self, term):
+        count = self._ref_counts.get(term, 0)
+        self._ref_counts[term] = count + 1
+        if count == 0:
+            for key in _keys(term[1]):
+                bisect.insort(self._entries, (key, term))
+
+    def _remove_term(self, term):
+        count = self._ref_counts.pop(term) - 1
+        if count > 0:
+            self._ref_counts[term] = count
+            return
+        for key in _keys(term[1]):
+            i = bisect.bisect_left(self._entries, (key, term))
+            if i < len(self._entries) and self._entries[i] == (key, term):
+                del self._entries[i]
+
+    def _set_object(self, owner, terms):
+        old_terms = self._owned_terms.pop(owner, set())
+        for term in old_terms - terms:
+            self._remove_term(term)
+        for term in terms - old_terms:
+            self._add_term(term)
+        if terms:
+            self._owned_terms[owner] = terms
+
+    def set_object(self, owner, terms):
+        """Replace the terms owned by an object, empty terms remove it."""
+        with self._lock:
+            self._set_object(owner, terms)
+
+    def rebuild(self, objects, version):
+        """Rebuild from an iterable of (owner, terms) pairs."""
+        ref_counts = {}
+        owned_terms = {}
+        for owner, terms in objects:
+            if terms:
+                owned_terms[owner] = terms
+                for term in terms:
+                    ref_counts[term] = ref_counts.get(term, 0) + 1
+        entries = sorted((key, term) for term in ref_counts
+                         for key in _keys(term[1]))
+        with self._lock:
+            self._entries = entries
+            self._ref_counts = ref_counts
+            self._owned_terms = owned_terms
+            self.version = version
+
+    def complete(self, prefix, count):
+        """Return at most "count" terms with a word starting with "prefix"."""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (prefix,))
+            while i < len(self._entries) and len(results) < count:
+                key, term = self._entries[i]
+                if not key.startswith(prefix):
+                    break
+                if term not in results:
+                    results.append(term)
+                i += 1
+        return results
+
+
+_index = SuggestIndex()
+_rebuild_lock = threading.Lock()
+
+
+def brand_terms(pk, name):
+    return {(KIND_BRAND, name, pk)} if name else set()
+
+
+def category_terms(pk, name):
+    return {(KIND_CATEGORY, name, pk)} if name else set()
+
+
+def product_terms(name, style):
+    return {(KIND_PRODUCT, text, None) for text in (name, style) if text}
+
+
+def _iter_all_objects():
+    from .models.product import Brand, Category, Product
+
+    for pk, name in Brand.objects.values_list('pk', 'name').iterator():
+        yield (KIND_BRAND, pk), brand_terms(pk, name)
+    for pk, name in Category.objects.values_list('pk', 'name').iterator():
+        yield (KIND_CATEGORY, pk), category_terms(pk, name)
+    for pk, name, style in Product.objects.values_list(
+            'pk', 'name', 'style').iterator():
+        yield (KIND_PRODUCT, pk), product_terms(name, style)
+
+
+def _rebuild():
+    global _index
+    try:
+        # read before the data, so changes made meanwhile make it stale
+        version = get_version('suggest')
+        index = SuggestIndex()
+        index.rebuild(_iter_all_objects(), version)
+        _index = index
+    finally:
+        _rebuild_lock.release()
+
+
+def get_suggest_index():
+    """
+    Get the index of this process. A stale index is returned as is, and
+    rebuilt in the background, except that the first build is waited for.
+    """
+    version = get_version('suggest')
+    if _index.version is None:
+        _rebuild_lock.acquire()
+        if _index.version is None:
+            _rebuild()
+        else:
+            _rebuild_lock.release()
+    elif _index.version != version and _rebuild_lock.acquire(blocking=False):
+        # one rebuild at a time, which releases the lock when done
+        async_run(_rebuild)
+    return _index
+
+
+def object_changed(kind, pk, terms):
+    """
+    Update the index after the current transaction commits,
+    with the new terms of an object, or empty terms if it's deleted.
+    """
+
+    def apply():
+        index = _index
+        old_version = index.version
+        version = bump_version('suggest')
+        if old_version is None:
+            # never built in this process, nothing to update
+            return
+        index.set_object((kind, pk), terms)
+        if version == old_version + 1:
+            # no one else changed anything since the index was built
+            index.version = version
+
+    transaction.on_commit(apply)
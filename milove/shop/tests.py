@@ -1,3 +1,125 @@
-from django.test import TestCase
+import random
 
-# Create your tests here.
+from django.test import TestCase, RequestFactory, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .models import *
+from .serializers.helpers import compile_serializer
+from .serializers.product import ProductSerializer, serialize_products
+
+
+def make_catalog(rand, product_count=60):
+    """Generate a random catalog, with every optional field sometimes empty."""
+    brands = [Brand.objects.create(name='Brand %s' % i) for i in range(4)]
+    locations = [ProductLocation.objects.create(name='Location %s' % i)
+                 for i in range(2)]
+    attachments = [Attachment.objects.create(name='Attachment %s' % i)
+                   for i in range(3)]
+    auth_methods = [AuthenticationMethod.objects.create(name='Method %s' % i)
+                    for i in range(3)]
+
+    detail_categories = []
+    for i in range(2):
+        top = Category.objects.create(name='Top %s' % i)
+        for j in range(2):
+            middle = Category.objects.create(name='Middle %s%s' % (i, j),
+                                             super_category=top)
+            for k in range(2):
+                detail_categories.append(Category.objects.create(
+                    name='Detail %s%s%s' % (i, j, k), super_category=middle))
+
+    def maybe(value):
+        return value if rand.random() < 0.7 else ''
+
+    for i in range(product_count):
+        product = Product.objects.create(
+            brand=rand.choice(brands),
+            name=maybe('Name %s' % i),
+            style=maybe('Style %s' % rand.randint(1, 5)),
+            color=maybe('Color %s' % rand.randint(1, 5)),
+            size=maybe('Size %s' % rand.randint(1, 5)),
+            condition=rand.choice(Product.CONDITIONS)[0],
+            description=maybe('Description %s' % i),
+            serial_code=maybe('SN%06d' % i),
+            location=rand.choice(locations + [None]),
+            purchase_year=rand.choice([None, 2015, 2016, 2017]),
+            original_price=rand.randint(500, 5000) + rand.random(),
+            buy_back_price=rand.choice([None, 100.0]),
+            price=float(rand.randint(100, 3000)),
+            show_on_homepage=rand.random() < 0.3,
+            sold=rand.random() < 0.3,
+        )
+        if rand.random() < 0.8:
+            product.main_image = 'products/%s/main.jpg' % i
+            product.save()
+        product.categories.add(*rand.sample(detail_categories,
+                                            rand.randint(0, 2)))
+        product.attachments.add(*rand.sample(attachments,
+                                             rand.randint(0, 3)))
+        product.authentication_methods.add(*rand.sample(auth_methods,
+                                                        rand.randint(0, 2)))
+        for j in range(rand.randint(0, 3)):
+            ProductImage.objects.create(
+                product=product, image='products/%s/%s.jpg' % (i, j))
+
+
+@override_settings(CATALOG_SNAPSHOT_PATH=None)
+class CompiledProductSerializerTest(TestCase):
+    """The compiled serializer must render exactly as ProductSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(random.Random(20171018))
+
+    def assertSameJSON(self, expected, actual):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(expected), renderer.render(actual))
+
+    def test_full_fields(self):
+        represent = compile_serializer(ProductSerializer())
+        for product in Product.objects.order_by('pk'):
+            self.assertSameJSON(ProductSerializer(product).data,
+                                represent(product))
+
+    def test_eager_loaded(self):
+        products = list(ProductSerializer.setup_eager_loading(
+            Product.objects.order_by('pk')))
+        represent = compile_serializer(ProductSerializer())
+        self.assertSameJSON(ProductSerializer(products, many=True).data,
+                            [represent(product) for product in products])
+
+    def test_fragment_cache(self):
+        products = list(Product.objects.order_by('pk'))
+        expected = ProductSerializer(products, many=True).data
+        # the first call fills the cache, the second reads it
+        self.assertSameJSON(expected, serialize_products(products))
+        self.assertSameJSON(expected, serialize_products(products))
+
+    def test_fragment_cache_after_category_deleted(self):
+        product = Product.objects.filter(
+            categories__super_category=None).order_by('pk').first()
+        top = product.categories.filter(super_category=None).first()
+        serialize_products([product])
+
+        top.delete()
+        product = Product.objects.get(pk=product.pk)
+        representation = serialize_products([product])[0]
+        self.assertSameJSON(ProductSerializer(product).data, representation)
+        self.assertNotIn(top.pk, [category['id'] for category
+                                  in representation['categories']])
+
+    def test_sparse_fields(self):
+        factory = RequestFactory()
+        for query in ('fields=id,price,brand,categories',
+                      'fields=id,categories.fullname,categories.level',
+                      'exclude=description,images,brand.name',
+                      'fields=main_image,location&exclude=location.id'):
+            request = Request(factory.get('/api/products/?' + query))
+            serializer = ProductSerializer(context={'request': request})
+            represent = compile_serializer(serializer)
+            for product in Product.objects.order_by('pk'):
+                self.assertSameJSON(
+                    ProductSerializer(product,
+                                      context={'request': request}).data,
+                    represent(product))
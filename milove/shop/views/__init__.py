@@ -1,16 +1,13 @@
-import os
-import hashlib
-
 from django.conf.urls import url
 from django import forms
-from django.utils.datetime_safe import datetime
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework import exceptions
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from ..validators import validate_uploaded_file_size
-from ..file_storage import storage
+from ..file_storage import blob_storage
+from ..image_utils import schedule_thumbnails
 from .helpers import validate_or_raise
 from . import (
     product,
@@ -23,6 +20,7 @@ from . import (
     sell_request,
     misc_info,
     withdrawal,
+    chunked_upload,
 )
 
 
@@ -49,22 +47,16 @@ def upload(request):
     validate_or_raise(form)
 
     file = request.FILES['file']
-    filename, ext = os.path.splitext(file.name)
-    now = datetime.now()
-    filename_hash = hashlib.md5()
-    filename_hash.update(file.name.encode('utf-8'))
-    filename_hash.update(str(now.timestamp()).encode('utf-8'))
-    filename = '{}-{}{}'.format(now.strftime('%Y%m%d%H%M%S'),
-                                filename_hash.hexdigest(), ext)
-
-    storage.save(os.path.join('uploads', filename), file)
-    return Response({'path': 'uploads/' + filename})
+    name = blob_storage.save(file.name, file)
+    schedule_thumbnails([name])
+    return Response({'path': name})
 
 
 urlpatterns = [
     url(r'^get_token/$', get_token),
     url(r'^upload/$', upload, name='upload'),
 ]
+urlpatterns += chunked_upload.urlpatterns
 urlpatterns += product.urlpatterns
 urlpatterns += user.urlpatterns
 urlpatterns += address.urlpatterns
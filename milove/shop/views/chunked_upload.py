@@ -0,0 +1,178 @@
+"""
+Resumable chunked uploads of images
+
+A client starts an upload with the name and size of the file, then PUTs
+chunks of the file in order, each with the offset it starts at, and
+finalizes the upload when all bytes are sent. After a lost connection,
+the client GETs the offset the server has received up to and goes on
+from there. Chunks are streamed to the partial file a piece at a time,
+so no request holds a whole file in memory, and the size and the type of
+the file are checked as soon as the bytes telling them arrive.
+"""
+
+import os
+from datetime import timedelta
+
+from django import forms
+from django.conf import settings
+from django.conf.urls import url
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from PIL import Image
+from rest_framework import exceptions, status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from ..models.chunked_upload import *
+from ..exceptions import UploadOffsetMismatch
+from ..file_storage import storage, blob_storage
+from ..image_utils import (
+    IMAGE_HEADER_SIZE,
+    sniff_image_format,
+    schedule_thumbnails
+)
+from .helpers import validate_or_raise
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# bytes read from the request and written at a time
+_PIECE_SIZE = 64 * 1024
+
+
+class InitUploadForm(forms.Form):
+    filename = forms.CharField(max_length=200)
+    size = forms.IntegerField(min_value=1,
+                              max_value=settings.MAX_UPLOAD_SIZE)
+
+    def clean_filename(self):
+        filename = self.cleaned_data['filename']
+        if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            raise forms.ValidationError(
+                _('File %(name)s is not a supported image.'),
+                params={'name': filename})
+        return filename
+
+
+def _represent(upload: ChunkedUpload):
+    return {'id': upload.id.hex, 'size': upload.size,
+            'offset': upload.offset}
+
+
+def _expired_before():
+    return timezone.now() - timedelta(
+        seconds=settings.CHUNKED_UPLOAD_EXPIRATION)
+
+
+def _get_upload(request, pk):
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated
+    return get_object_or_404(ChunkedUpload, pk=pk, user=request.user,
+                             created_dt__gte=_expired_before())
+
+
+def _file_error(message):
+    return exceptions.ValidationError({'file': [message]})
+
+
+@api_view(['POST'])
+def init_upload(request):
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated
+
+    form = InitUploadForm(request.data)
+    validate_or_raise(form)
+
+    # discard expired uploads of everyone, with their partial files
+    ChunkedUpload.objects.filter(created_dt__lt=_expired_before()).delete()
+
+    upload = ChunkedUpload.objects.create(user=request.user,
+                                          **form.cleaned_data)
+    path = storage.path(upload.partial_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return Response(_represent(upload), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT'])
+def upload_chunk(request, pk):
+    upload = _get_upload(request, pk)
+    if request.method == 'GET':
+        return Response(_represent(upload))
+
+    try:
+        offset = int(request.query_params['offset'])
+    except (KeyError, ValueError):
+        raise exceptions.ValidationError(
+            {'offset': [_('A valid integer is required.')]})
+    if offset != upload.offset:
+        raise UploadOffsetMismatch
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise exceptions.ParseError(_('Invalid Content-Length header.'))
+    if offset + length > upload.size:
+        raise _file_error(_('The chunk exceeds the size of the upload.'))
+
+    received = 0
+    with open(storage.path(upload.partial_name), 'r+b') as f:
+        f.seek(offset)
+        while received < length:
+            try:
+                piece = request.stream.read(
+                    min(_PIECE_SIZE, length - received))
+            except (IOError, OSError):
+                # the connection is lost, keep what's received
+                break
+            if not piece:
+                break
+            f.write(piece)
+            received += len(piece)
+
+        end = offset + received
+        if offset < IMAGE_HEADER_SIZE \
+                and (end >= IMAGE_HEADER_SIZE or end == upload.size):
+            # the header is complete, check the type before going on
+            f.seek(0)
+            if sniff_image_format(f.read(IMAGE_HEADER_SIZE)) is None:
+                upload.delete()
+                raise _file_error(_('The file is not a supported image.'))
+
+    # a concurrent request of the same offset may have won
+    if not ChunkedUpload.objects.filter(
+            pk=upload.pk, offset=offset).update(offset=end):
+        raise UploadOffsetMismatch
+    upload.offset = end
+    return Response(_represent(upload))
+
+
+@api_view(['POST'])
+def finalize_upload(request, pk):
+    upload = _get_upload(request, pk)
+    if upload.offset != upload.size:
+        raise _file_error(_('The upload is not complete.'))
+
+    with storage.open(upload.partial_name, 'rb') as f:
+        try:
+            # checks the structure of the file, without decoding pixels
+            Image.open(f).verify()
+        except Exception:
+            # Pillow raises all kinds of errors on malformed files,
+            # like "ImageField" does, treat any of them as invalid
+            upload.delete()
+            raise _file_error(_('The file is not a supported image.'))
+        f.seek(0)
+        name = blob_storage.save(upload.filename, f)
+    upload.delete()
+
+    schedule_thumbnails([name])
+    return Response({'path': name})
+
+
+urlpatterns = [
+    url(r'^uploads/$', init_upload, name='chunked_upload'),
+    url(r'^uploads/(?P<pk>[0-9a-f]{32})/$', upload_chunk),
+    url(r'^uploads/(?P<pk>[0-9a-f]{32})/finalization/$', finalize_upload),
+]
@@ -1,6 +1,21 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import exceptions as rest_exceptions
+from rest_framework.response import Response
 from rest_framework.viewsets import mixins
 
+from ..serializers.helpers import compile_serializer
+from ..cache_utils import (
+    get_version,
+    get_last_modified,
+    normalize_query_string
+)
+
 
 def validate_or_raise(form_or_serializer):
     if not form_or_serializer.is_valid():
@@ -13,3 +28,85 @@ class PartialUpdateModelMixin(mixins.UpdateModelMixin):
             # entire update is not allowed
             raise rest_exceptions.MethodNotAllowed(request.method)
         return super().update(request, *args, **kwargs)
+
+
+class CompiledListModelMixin(mixins.ListModelMixin):
+    """List with the serializer compiled by "compile_serializer"."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        represent = compile_serializer(self.get_serializer())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                [represent(obj) for obj in page])
+        return Response([represent(obj) for obj in queryset])
+
+
+class CatalogConditionalGetMixin(object):
+    """Conditional GET by the catalog version
+
+    Responses of safe requests get ETag and Last-Modified headers derived
+    from the "catalog" version counter, which changes on any write to
+    catalog models. A request whose "If-None-Match" or "If-Modified-Since"
+    is still up to date gets a 304 before any database query or
+    serialization happens.
+    """
+
+    # actions whose responses vary between requests, e.g. random ones
+    conditional_get_excluded_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if request.method not in ('GET', 'HEAD') \
+                or action in self.conditional_get_excluded_actions:
+            return super().dispatch(request, *args, **kwargs)
+
+        etag_hash = hashlib.md5()
+        etag_hash.update(str(get_version('catalog')).encode('utf-8'))
+        # the rendered format depends on "Accept"
+        etag_hash.update(request.META.get('HTTP_ACCEPT', '').encode('utf-8'))
+        etag = quote_etag(etag_hash.hexdigest())
+        last_modified = get_last_modified('catalog')
+
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+def cache_catalog_response(func):
+    """Cache response data of a public catalog view method
+
+    The cache key is made of the catalog version, the view,
+    and the normalized request URL, so a hit skips querying
+    and serializing entirely, and any catalog change misses.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        url_hash = hashlib.md5()
+        url_hash.update('{}:{}?{}'.format(
+            self.__class__.__name__,
+            # paginated responses contain absolute URLs
+            request.build_absolute_uri(request.path),
+            normalize_query_string(request.query_params)
+        ).encode('utf-8'))
+        key = 'catalog_response:%s:%s' % (get_version('catalog'),
+                                          url_hash.hexdigest())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = func(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data,
+                      settings.CATALOG_RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
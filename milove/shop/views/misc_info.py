@@ -4,9 +4,10 @@ from rest_framework.response import Response
 
 from ..models.misc_info import *
 from ..serializers.misc_info import *
+from .helpers import CatalogConditionalGetMixin
 
 
-class MiscInfoView(APIView):
+class MiscInfoView(CatalogConditionalGetMixin, APIView):
     def get(self, request, format=None):
         misc_info = MiscInfo.get_solo()
         serializer = MiscInfoSerializer(misc_info)
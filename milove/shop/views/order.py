@@ -5,33 +5,42 @@ from rest_framework.routers import SimpleRouter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import detail_route
-from rest_framework.pagination import PageNumberPagination
 
 from ..models.order import *
 from ..models.payment import Payment
 from ..serializers.order import *
-from .. import rest_filters
-from .helpers import validate_or_raise, PartialUpdateModelMixin
+from .. import rest_filters, rest_pagination
+from .helpers import (
+    validate_or_raise,
+    PartialUpdateModelMixin,
+    CompiledListModelMixin
+)
 
 router = SimpleRouter()
 
 
-class OrderViewSet(PartialUpdateModelMixin,
+class OrderViewSet(CompiledListModelMixin,
+                   PartialUpdateModelMixin,
                    viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        queryset = Order.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = OrderSerializer.setup_eager_loading(queryset,
+                                                           self.request)
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderAddSerializer
         return OrderSerializer
 
-    class Pagination(PageNumberPagination):
+    class Pagination(rest_pagination.KeysetOrPageNumberPagination):
         page_size = 15
         page_size_query_param = 'page_size'
         max_page_size = 30
+        keyset_ordering = ('-created_dt', '-id')
 
     class Filter(django_filters.rest_framework.FilterSet):
         created_dt = django_filters.rest_framework.DateFromToRangeFilter()
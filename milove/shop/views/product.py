@@ -1,50 +1,76 @@
 import random
+from collections import OrderedDict
+from datetime import timedelta
 
 import django_filters.rest_framework
 import rest_framework.filters
-from rest_framework import viewsets, serializers
-from rest_framework.decorators import list_route
+from rest_framework import viewsets
+from rest_framework.decorators import list_route, detail_route
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.routers import SimpleRouter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.settings import api_settings
 from django.conf import settings
-from django.db import models, transaction
+from django.core.cache import cache
+from django.db import models
 from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
 from ..models.product import *
+from ..models.recommendation import ProductNeighbour
 from ..serializers.product import *
-from .. import rest_filters
+from ..serializers.helpers import compile_serializer
+from .. import rest_filters, rest_pagination
+from ..catalog_feed import FEED_FORMATS, FEED_CONTENT_TYPES, iter_feed
+from ..cache_utils import get_version, normalize_query_string
+from ..catalog_snapshot import get_current_snapshot
+from ..search import get_search_backend
+from ..suggest import get_suggest_index
+from ..image_similarity import find_similar_products
+from .helpers import CatalogConditionalGetMixin, cache_catalog_response
 
 router = SimpleRouter()
 
 
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(CatalogConditionalGetMixin,
+                   viewsets.ReadOnlyModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     ordering = ('name',)
+    ordering_fields = ('name', 'product_count', 'for_sale_count')
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        snapshot = get_current_snapshot()
+        if snapshot is not None and not request.query_params:
+            return Response(snapshot.brands())
+        return super().list(request, *args, **kwargs)
 
-router.register('brands', BrandViewSet)
-
-
-class CategoryTreeSerializer(serializers.ModelSerializer):
-    """Special serializer for CategoryViewSet"""
-
-    class Meta:
-        model = Category
-        exclude = ('super_category',)
-        depth = 10  # this is intended to be large
-
-
-# the following line is a hack to accomplish self nested serialization
-# https://stackoverflow.com/questions/13376894/django-rest-framework-nested-self-referential-objects
 
-# noinspection PyProtectedMember
-CategoryTreeSerializer._declared_fields['children'] \
-    = CategoryTreeSerializer(many=True)
+router.register('brands', BrandViewSet)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+def _build_category_tree(root_ids):
+    """Build category trees from one flat query, in the same format
+    the old self nested "CategoryTreeSerializer" produced."""
+    nodes = OrderedDict()
+    for cat in Category.objects.order_by('pk').values(
+            'id', 'name', 'level', 'super_category_id'):
+        nodes[cat['id']] = (cat['super_category_id'], OrderedDict((
+            ('id', cat['id']),
+            ('children', []),
+            ('name', cat['name']),
+            ('level', cat['level']),
+        )))
+    for parent_id, node in nodes.values():
+        if parent_id in nodes:
+            nodes[parent_id][1]['children'].append(node)
+    return [nodes[pk][1] for pk in root_ids if pk in nodes]
+
+
+class CategoryViewSet(CatalogConditionalGetMixin,
+                      viewsets.ReadOnlyModelViewSet):
     class Filter(django_filters.rest_framework.FilterSet):
         level = django_filters.rest_framework.NumberFilter()
         super_category = rest_filters.CommaSplitListFilter()
@@ -60,17 +86,29 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     def list(self, request, *args, **kwargs):
         structure = request.GET.get('structure')
         if structure == 'tree':
-            # only get the root level categories,
-            # sub categories will be nested in 'children' field
-            # see Serializer class
-            queryset = self.filter_queryset(self.get_queryset()).filter(
-                super_category=None)
-            serializer = CategoryTreeSerializer(queryset, many=True)
-            return Response(serializer.data)
+            # the tree changes rarely, so cache it until any category changes,
+            # expiring anyway in case it's cached from an outdated read
+            cache_key = 'category_tree:%s:%s' % (
+                get_version('category'), normalize_query_string(request.GET))
+            data = cache.get(cache_key)
+            snapshot = get_current_snapshot()
+            if data is None and snapshot is not None \
+                    and list(request.query_params.keys()) == ['structure']:
+                data = snapshot.category_tree()
+            if data is None:
+                # only get the root level categories,
+                # sub categories will be nested in 'children' field
+                root_ids = self.filter_queryset(self.get_queryset()).filter(
+                    super_category=None).values_list('pk', flat=True)
+                data = _build_category_tree(list(root_ids))
+                cache.set(cache_key, data,
+                          settings.CATALOG_RESPONSE_CACHE_TIMEOUT)
+            return Response(data)
         # default list structure
         return super().list(request, *args, **kwargs)
 
     @list_route()
+    @cache_catalog_response
     def hot(self, request, **kwargs):
         try:
             count = int(request.GET['count'])
@@ -78,8 +116,6 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
             count = settings.DEFAULT_HOT_CATEGORIES
         queryset = self.get_queryset().filter(
             level=settings.DETAIL_CATEGORY_LEVEL
-        ).annotate(
-            product_count=models.Count('products')
         ).order_by('-product_count')[:count]
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
@@ -88,7 +124,8 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
 router.register('categories', CategoryViewSet)
 
 
-class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
+class AttachmentViewSet(CatalogConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
 
@@ -96,11 +133,13 @@ class AttachmentViewSet(viewsets.ReadOnlyModelViewSet):
 router.register('attachments', AttachmentViewSet)
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    class Pagination(PageNumberPagination):
+class ProductViewSet(CatalogConditionalGetMixin,
+                     viewsets.ReadOnlyModelViewSet):
+    class Pagination(rest_pagination.KeysetOrPageNumberPagination):
         page_size = 20
         page_size_query_param = 'page_size'
         max_page_size = 50
+        keyset_ordering = ('sold', '-published_dt', '-id')
 
     class Filter(django_filters.rest_framework.FilterSet):
         id = rest_filters.CommaSplitListFilter()
@@ -126,6 +165,20 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
                 ordering = ('sold',) + tuple(ordering)
             return ordering
 
+    class SearchFilter(rest_framework.filters.SearchFilter):
+        def filter_queryset(self, request, queryset, view):
+            terms = self.get_search_terms(request)
+            if not terms:
+                return queryset
+
+            backend = get_search_backend()
+            queryset = backend.search(queryset, terms)
+            ordered = api_settings.ORDERING_PARAM in request.query_params
+            if backend.ranked and not ordered:
+                # most relevant unsold first
+                queryset = queryset.order_by('sold', '-search_rank')
+            return queryset
+
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     pagination_class = Pagination
@@ -133,25 +186,156 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (
         django_filters.rest_framework.DjangoFilterBackend,
         OrderingFilter,  # use custom ordering backend
-        rest_framework.filters.SearchFilter
+        SearchFilter,  # use full-text search backend
     )
 
     # most recently published unsold first
     ordering = ('sold', '-published_dt',)
-    search_fields = ('brand__name', 'name', 'style', 'size',
-                     'categories__name', 'description')
+
+    # recommendations are random, while changes, suggestions and image
+    # hashes are updated after commit, which is later than the catalog
+    # version is bumped
+    conditional_get_excluded_actions = ('recommendation', 'changes',
+                                        'suggest', 'similar_images', 'feed')
+
+    def _use_fragment_cache(self):
+        include, exclude = ProductSerializer.get_sparse_fields(self.request)
+        return include is None and not exclude
+
+    def get_queryset(self):
+        if self._use_fragment_cache():
+            # representations come from the fragment cache,
+            # only fetch what's needed to find them, and to paginate
+            return super().get_queryset().only(
+                'id', 'row_version', 'sold', 'published_dt')
+
+        # only fetch what the sparse serializer needs
+        field_names = ProductSerializer(
+            context=self.get_serializer_context()).fields.keys()
+        return ProductSerializer.setup_eager_loading(super().get_queryset(),
+                                                     field_names)
+
+    def serialize(self, products):
+        if self._use_fragment_cache():
+            return serialize_products(products)
+        represent = compile_serializer(self.get_serializer())
+        return [represent(prod) for prod in products]
+
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize(page))
+        return Response(self.serialize(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize([self.get_object()])[0])
 
     @list_route()
+    @cache_catalog_response
     def homepage(self, request, **kwargs):
         try:
             count = int(request.GET['count'])
         except (KeyError, ValueError):
             count = settings.DEFAULT_PRODUCTS_ON_HOMEPAGE
         count = min(count, settings.MAX_PRODUCTS_ON_HOMEPAGE)
+        snapshot = get_current_snapshot()
+        if snapshot is not None and self._use_fragment_cache():
+            # the snapshot is of the current catalog, so are its cards
+            cards = map(snapshot.get_card, snapshot.homepage_ids(count))
+            return Response([card for card in cards if card is not None])
         queryset = self.get_queryset().filter(
             sold=False).order_by('-show_on_homepage')[:count]
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return Response(self.serialize(queryset))
+
+    def _filter_queryset_without(self, request, param):
+        """Apply all filters and search, except the one named "param"."""
+        data = request.query_params.copy()
+        for key in list(data.keys()):
+            if key == param or key.startswith(param + '_'):
+                del data[key]
+        queryset = self.Filter(data, queryset=Product.objects.all(),
+                               request=request).qs
+        return self.SearchFilter().filter_queryset(request, queryset, self)
+
+    def _count_facet(self, request, param, queryset, fields,
+                     product_field='pk'):
+        """Count products by "fields", with the "param" filter excluded.
+
+        "fields" is a sequence of (output name, lookup) pairs.
+        """
+        pks = self._filter_queryset_without(request, param).order_by(
+        ).values('pk')
+        rows = queryset.filter(**{product_field + '__in': pks}).values(
+            *(lookup for _, lookup in fields)
+        ).annotate(
+            count=models.Count(product_field)
+        ).order_by('-count')
+        return [OrderedDict([(name, row[lookup]) for name, lookup in fields]
+                            + [('count', row['count'])])
+                for row in rows]
+
+    @list_route()
+    def facets(self, request, **kwargs):
+        """Count products for sidebar filters
+
+        Each facet is counted with all the current filters but its own,
+        so that other options of the same facet still have their counts.
+        """
+        cache_key = 'product_facets:%s:%s' % (
+            get_version('catalog'),
+            normalize_query_string(request.GET, ignored=(
+                'page', 'page_size', api_settings.ORDERING_PARAM)))
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+
+        brands = self._count_facet(
+            request, 'brand', Product.objects.all(),
+            (('id', 'brand'), ('name', 'brand__name')))
+        conditions = self._count_facet(
+            request, 'condition', Product.objects.all(),
+            (('value', 'condition'),))
+        categories = self._count_facet(
+            request, 'categories',
+            Product.categories.through.objects.filter(
+                category__level=settings.DETAIL_CATEGORY_LEVEL),
+            (('id', 'category'), ('name', 'category__full_name')),
+            product_field='product')
+
+        bounds = tuple(settings.PRICE_BANDS) + (None,)
+        bands = list(zip(bounds[:-1], bounds[1:]))
+        band_conditions = []
+        for low, high in bands:
+            condition = Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            band_conditions.append(condition)
+        pks = self._filter_queryset_without(request, 'price').order_by(
+        ).values('pk')
+        band_counts = Product.objects.filter(pk__in=pks).aggregate(**{
+            'band_%s' % i: models.Sum(models.Case(
+                models.When(condition, then=1),
+                default=0,
+                output_field=models.IntegerField()
+            )) for i, condition in enumerate(band_conditions)
+        })
+        prices = [OrderedDict((
+            ('min', low),
+            ('max', high),
+            ('count', band_counts['band_%s' % i] or 0),
+        )) for i, (low, high) in enumerate(bands)]
+
+        data = OrderedDict((
+            ('brand', brands),
+            ('condition', conditions),
+            ('categories', categories),
+            ('price', prices),
+        ))
+        # keys come from query strings of clients, so entries must expire
+        cache.set(cache_key, data, settings.CATALOG_RESPONSE_CACHE_TIMEOUT)
+        return Response(data)
 
     @list_route()
     def recommendation(self, request, **kwargs):
@@ -160,45 +344,133 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         except (KeyError, ValueError):
             count = settings.DEFAULT_PRODUCTS_ON_HOMEPAGE
         count = min(count, settings.MAX_RECOMMENDED_PRODUCTS)
-        recent = filter(lambda x: x.isdigit(),
-                        request.GET.get('recent_visited', '').split(','))
-        recent_products = Product.objects.filter(pk__in=recent)[:10]
-        brands = set()
-        categories = set()
-        for prod in recent_products:
-            brands.add(prod.brand)
-            categories.update(prod.categories.filter(
-                level=settings.DETAIL_CATEGORY_LEVEL
-            ))
-
-        recommended_products = []
-        with transaction.atomic():
-            qs = Product.objects.filter(
-                Q(brand__in=brands) | Q(categories__in=categories),
-                sold=False,
-            )
-            total_count = qs.count()
-            recommended_indexes = random.sample(
-                range(total_count),
-                k=min(count, total_count)
-            )
-            [recommended_products.append(qs[i]) for i in recommended_indexes]
-
-        extra_count = count - len(recommended_products)
+        recent = [int(x) for x in
+                  request.GET.get('recent_visited', '').split(',')
+                  if x.isdigit()][:10]
+
+        # weigh each neighbour by its similarity to all recent products
+        weights = {}
+        for pk, score in ProductNeighbour.objects.filter(
+                product__in=recent, neighbour__sold=False
+        ).exclude(neighbour__in=recent).values_list('neighbour', 'score'):
+            weights[pk] = weights.get(pk, 0.0) + max(score, 0.0)
+
+        # weighted random sampling without replacement (Efraimidis-Spirakis)
+        keyed = sorted(((random.random() ** (1.0 / w), pk)
+                        for pk, w in weights.items() if w > 0),
+                       reverse=True)
+        recommended_pks = [pk for _, pk in keyed[:count]]
+
+        extra_count = count - len(recommended_pks)
         if extra_count > 0:
-            # not enough
-            qs = Product.objects.filter(sold=False).exclude(
-                Q(brand__in=brands) | Q(categories__in=categories)
-            )
-            total_count = qs.count()
-            recommended_indexes = random.sample(
-                range(total_count),
-                k=min(extra_count, total_count)
-            )
-            [recommended_products.append(qs[i]) for i in recommended_indexes]
-
-        serializer = self.get_serializer(recommended_products, many=True)
-        return Response(serializer.data)
+            # not enough, pick from the latest unsold products
+            pks = list(Product.objects.filter(sold=False).exclude(
+                pk__in=recent + recommended_pks
+            ).order_by('-published_dt').values_list(
+                'pk', flat=True)[:extra_count * 5])
+            recommended_pks += random.sample(pks,
+                                             k=min(extra_count, len(pks)))
+
+        products = self.get_queryset().in_bulk(recommended_pks)
+        recommended_products = [products[pk] for pk in recommended_pks
+                                if pk in products]
+        return Response(self.serialize(recommended_products))
+
+    @list_route()
+    def changes(self, request, **kwargs):
+        """
+        Changes of products after the cursor given by "since", in commit
+        order, for consumers to sync the catalog incrementally. Products
+        created, updated or sold are to be fetched again, and those deleted
+        are to be dropped.
+
+        Changes are committed by concurrent transactions, so a change may
+        commit after one with a greater "id". To never move the cursor past
+        a change not committed yet, only changes older than
+        PRODUCT_CHANGES_LAG seconds are returned, and the page stops at the
+        first one newer than that, which means a consumer sees a change
+        a few seconds after it is made.
+        """
+        try:
+            since = int(request.GET.get('since', 0))
+        except ValueError:
+            since = 0
+        try:
+            count = int(request.GET['count'])
+        except (KeyError, ValueError):
+            count = settings.DEFAULT_PRODUCT_CHANGES
+        count = max(min(count, settings.MAX_PRODUCT_CHANGES), 1)
+
+        changes = list(ProductChange.objects.filter(id__gt=since).order_by(
+            'id').values('id', 'product_id', 'kind', 'changed_dt')[:count + 1])
+        has_more = len(changes) > count
+        changes = changes[:count]
+        # the low-water mark, below which all changes are committed
+        committed_before = timezone.now() - timedelta(
+            seconds=settings.PRODUCT_CHANGES_LAG)
+        for i, change in enumerate(changes):
+            if change['changed_dt'] > committed_before:
+                changes = changes[:i]
+                has_more = False
+                break
+        return Response(OrderedDict((
+            ('cursor', changes[-1]['id'] if changes else since),
+            ('has_more', has_more),
+            ('changes', [OrderedDict((
+                ('id', change['product_id']),
+                ('kind', change['kind']),
+                ('sequence', change['id']),
+                ('changed_dt', change['changed_dt']),
+            )) for change in changes]),
+        )))
+
+    @detail_route()
+    def similar_images(self, request, pk=None, **kwargs):
+        """Unsold products that look like this one, the most similar first."""
+        try:
+            count = int(request.GET['count'])
+        except (KeyError, ValueError):
+            count = settings.DEFAULT_RECOMMENDED_PRODUCTS
+        count = min(count, settings.MAX_RECOMMENDED_PRODUCTS)
+
+        product = self.get_object()
+        hashes = [product.main_image_hash] + list(
+            product.images.values_list('image_hash', flat=True))
+        similar_pks = find_similar_products(
+            filter(None, hashes), settings.SIMILAR_IMAGE_DISTANCE,
+            exclude={product.pk})
+        products = self.get_queryset().filter(sold=False).in_bulk(
+            similar_pks[:count * 5])
+        return Response(self.serialize([products[pk] for pk in similar_pks
+                                        if pk in products][:count]))
+
+    @list_route()
+    def suggest(self, request, **kwargs):
+        """Complete the search box, from brands, categories and products."""
+        try:
+            count = int(request.GET['count'])
+        except (KeyError, ValueError):
+            count = settings.DEFAULT_SUGGESTIONS
+        count = min(count, settings.MAX_SUGGESTIONS)
+        terms = get_suggest_index().complete(request.GET.get('q', ''), count)
+        return Response([OrderedDict((
+            ('type', kind),
+            ('text', text),
+            ('id', pk),
+        )) for kind, text, pk in terms])
+
+    @list_route(permission_classes=(IsAdminUser,))
+    def feed(self, request, **kwargs):
+        """Stream the feed of unsold products, as CSV or RSS."""
+        feed_format = request.GET.get('type')
+        if feed_format not in FEED_FORMATS:
+            feed_format = FEED_FORMATS[0]
+        response = StreamingHttpResponse(
+            iter_feed(feed_format, request.build_absolute_uri('/')),
+            content_type=FEED_CONTENT_TYPES[feed_format])
+        response['Content-Disposition'] = \
+            'attachment; filename="catalog.%s"' % feed_format
+        return response
 
 
 router.register('products', ProductViewSet)
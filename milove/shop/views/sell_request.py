@@ -6,12 +6,11 @@ from rest_framework.routers import SimpleRouter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import detail_route
-from rest_framework.pagination import PageNumberPagination
 
 from ..models.sell_request import *
 from ..models.address import Address
 from ..serializers.sell_request import *
-from .. import rest_filters
+from .. import rest_filters, rest_pagination
 from .helpers import validate_or_raise
 
 router = SimpleRouter()
@@ -36,10 +35,11 @@ class SellRequestViewSet(mixins.CreateModelMixin,
     def get_queryset(self):
         return SellRequest.objects.filter(user=self.request.user)
 
-    class Pagination(PageNumberPagination):
+    class Pagination(rest_pagination.KeysetOrPageNumberPagination):
         page_size = 15
         page_size_query_param = 'page_size'
         max_page_size = 30
+        keyset_ordering = ('-created_dt', '-id')
 
     class Filter(django_filters.rest_framework.FilterSet):
         created_dt = django_filters.rest_framework.DateFromToRangeFilter()